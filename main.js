@@ -25,14 +25,13 @@ console.log('[MAIN] main.js started');
 const { ipcMain, shell, BrowserWindow, app } = require('electron');
 const path = require('path');
 const puppeteer = require('puppeteer');
-const fs = require('fs');
 // Import your process_link module
 const { process_link } = require('./scripts/process_link.js');
 const { get_yt_dlp_link } = require('./scripts/get_yt_dlp_link.js');
 const { exportCookiesForService } = require('./scripts/cookie_exporter.js');
 const { get_browse_url } = require('./scripts/get_browse_url');
 
-const { execFile } = require('child_process');
+const { spawn } = require('child_process');
 
 
 function createWindow() {
@@ -55,6 +54,10 @@ app.on('window-all-closed', () => {
   if (process.platform !== 'darwin') app.quit();
 });
 
+app.on('will-quit', () => {
+  stopPythonWorker();
+});
+
 app.on('activate', () => {
   if (BrowserWindow.getAllWindows().length === 0) createWindow();
 });
@@ -81,9 +84,13 @@ ipcMain.on('run-process-link', async (event, { url, service, media }) => {
       // Send back result to renderer process
       event.sender.send('process-link-result', { success: true,  });
       //await exportCookiesForService(service);
-      await runPythonScript('download_song.py', [ytUrls.trackUrl, ytUrls.albumUrl, ytUrls.thumbnailUrl, service, media]);
-      await runPythonScript('fetch_metadata.py', []);
-      await runPythonScript('embed_metadata.py', []);
+      await runPythonCommand('run_pipeline', {
+        url: ytUrls.trackUrl,
+        playlistUrl: ytUrls.albumUrl,
+        thumbnailUrl: ytUrls.thumbnailUrl,
+        service,
+        media
+      });
       console.log(`[MAIN] Done processing YouTube Music: ${url}`);
       event.sender.send('process-link-result', {
         success: true,
@@ -97,9 +104,13 @@ ipcMain.on('run-process-link', async (event, { url, service, media }) => {
       const ytUrl = url.toString();
       console.log('process-link-result', { success: true, ytUrl , typeof: typeof ytUrl});
       await exportCookiesForService(service);
-      await runPythonScript('download_song.py', [ytUrl, albumUrl=null, service='youtube_music', media]);
-      await runPythonScript('fetch_metadata.py', []);
-      await runPythonScript('embed_metadata.py', []);
+      await runPythonCommand('run_pipeline', {
+        url: ytUrl,
+        playlistUrl: null,
+        thumbnailUrl: null,
+        service: 'youtube_music',
+        media
+      });
       console.log(`[MAIN] Done processing: ${url}`);
       event.sender.send('process-link-result', {
         success: true,
@@ -119,34 +130,98 @@ ipcMain.on('run-process-link', async (event, { url, service, media }) => {
   }
 });
 
-async function readMetadataFromFile(fileName = 'download_song_output.txt') {
-  const filePath = path.join(__dirname, fileName);
+// Resident Python worker (scripts/worker.py). It is spawned once and then
+// receives JSON-lines requests, so the stages don't pay interpreter startup
+// and imports of yt_dlp/openai/mutagen/PIL on every link.
+let pythonWorker = null;
+
+function getPythonWorker() {
+  if (pythonWorker) return pythonWorker;
+
+  const proc = spawn('python', [path.join(__dirname, 'scripts', 'worker.py')]);
+  const pending = new Map();
+  let nextId = 1;
+  let buffered = '';
+
+  proc.stdout.setEncoding('utf-8');
+  proc.stdout.on('data', (chunk) => {
+    buffered += chunk;
+    let newline;
+    while ((newline = buffered.indexOf('\n')) >= 0) {
+      const line = buffered.slice(0, newline).trim();
+      buffered = buffered.slice(newline + 1);
+      if (!line) continue;
+
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (error) {
+        console.log(`[PY STDOUT] ${line}`);
+        continue;
+      }
+      const request = pending.get(message.id);
+      if (!request) continue;
+      pending.delete(message.id);
+      if (message.ok) {
+        request.resolve(message.result);
+      } else {
+        request.reject(new Error(message.error));
+      }
+    }
+  });
 
-  try {
-    const fileContents = fs.readFileSync(filePath, 'utf-8');
-    const metadata = JSON.parse(fileContents);
-    return metadata;
-  } catch (error) {
-    console.error('Error reading or parsing metadata file:', error);
-    return null;
+  proc.stderr.on('data', (data) => {
+    console.error(`[PY STDERR] ${data}`);
+  });
+
+  // Rejects everything still waiting on this worker and forgets it, so the
+  // next command spawns a fresh one.
+  function failAll(error) {
+    for (const request of pending.values()) {
+      request.reject(error);
+    }
+    pending.clear();
+    if (pythonWorker && pythonWorker.proc === proc) pythonWorker = null;
   }
-}
 
-function runPythonScript(scriptName, args = []) {
-  const scriptPath = path.join(__dirname, 'scripts', scriptName);
+  proc.on('exit', (code) => {
+    console.error(`[MAIN] Python worker exited with code ${code}`);
+    failAll(new Error(`Python worker exited with code ${code}`));
+  });
 
-  return new Promise((resolve, reject) => {
-    execFile('python', [scriptPath, ...args], (error, stdout, stderr) => {
-      if (error) {
-        console.error(`[ERROR] ${error.message}`);
-        reject(error);
-        return;
-      }
-      if (stderr) {
-        console.error(`[PY STDERR] ${stderr}`);
-      }
-      console.log(`[PY STDOUT] ${stdout}`);
-      resolve(stdout);
-    });
+  // Spawn failures (python not on PATH) emit 'error' and may never emit
+  // 'exit'; a worker that died mid-job makes the next write fail with EPIPE.
+  proc.on('error', (error) => {
+    console.error('[MAIN] Python worker error:', error);
+    failAll(error);
+  });
+
+  proc.stdin.on('error', (error) => {
+    console.error('[MAIN] Python worker stdin error:', error);
+    failAll(error);
   });
+
+  pythonWorker = {
+    proc,
+    request(command, args = {}) {
+      return new Promise((resolve, reject) => {
+        const id = nextId++;
+        pending.set(id, { resolve, reject });
+        proc.stdin.write(JSON.stringify({ id, command, args }) + '\n', (error) => {
+          if (error && pending.delete(id)) reject(error);
+        });
+      });
+    }
+  };
+  return pythonWorker;
+}
+
+function runPythonCommand(command, args = {}) {
+  return getPythonWorker().request(command, args);
+}
+
+function stopPythonWorker() {
+  if (!pythonWorker) return;
+  pythonWorker.proc.stdin.end(JSON.stringify({ id: 0, command: 'shutdown' }) + '\n');
+  pythonWorker = null;
 }
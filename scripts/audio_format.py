@@ -0,0 +1,54 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Where the audio sits inside a downloaded file, read from the container
+# headers alone. Shared by the tagger and the library index, so neither has
+# to import the other.
+
+import os
+
+MP4_EXTENSIONS = ('.m4a', '.m4b', '.mp4')
+
+def is_mp4(file_path):
+    return os.path.splitext(file_path or '')[1].lower() in MP4_EXTENSIONS
+
+def id3_tag_size(file_path):
+    # Size of the ID3v2 tag at the start of the file (header and padding
+    # included), read from the 10-byte header only. 0 if there is none.
+    with open(file_path, 'rb') as f:
+        header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7f)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+def mp4_audio_range(path):
+    # (offset, length) of the mdat atom, or (0, None) for the whole file when
+    # the atoms cannot be read.
+    from mutagen.mp4 import Atoms
+    with open(path, 'rb') as f:
+        try:
+            mdat = Atoms(f)[b'mdat']
+        except Exception:
+            return 0, None
+    return mdat.offset, mdat.length
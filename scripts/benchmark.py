@@ -0,0 +1,369 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Offline benchmark for the download -> enrich -> embed pipeline.
+#
+# The sample download_song_output.txt / fetch_metadata_output.txt are replayed
+# as fixtures and every network dependency is replaced by a local stand-in:
+#   - yt_dlp is swapped for a fake extractor/downloader that writes a small
+#     silent MP3 instead of fetching and transcoding audio,
+#   - the OpenAI client is a stub that answers from the fixtures after a
+#     configurable delay,
+#   - thumbnails are served by a local HTTP server.
+# Each stage is timed at every size in a fresh working directory (cold caches)
+# and the results are written as JSON so runs can be compared across versions.
+#
+#   python scripts/benchmark.py                          # 1, 10, 100, 1000 tracks
+#   python scripts/benchmark.py --sizes 10 100 --output new.json --compare old.json
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+DEFAULT_SIZES = [1, 10, 100, 1000]
+DEFAULT_OUTPUT = 'benchmark_results.json'
+STAGES = ['download_song_with_metadata', 'fetch_metadata', 'crop_thumbnail', 'embed_metadata']
+
+# One MPEG-1 Layer III frame (128 kbps, 44.1 kHz) of silence. A few hundred of
+# them make a file mutagen reads like any other MP3.
+MP3_FRAME = b'\xff\xfb\x90\x64' + bytes(413)
+MP3_FRAMES = 200
+
+def load_fixtures():
+    with open(os.path.join(ROOT_DIR, 'download_song_output.txt'), encoding='utf-8') as f:
+        downloads = json.load(f)
+    with open(os.path.join(ROOT_DIR, 'fetch_metadata_output.txt'), encoding='utf-8') as f:
+        enriched = json.load(f)
+    return downloads, {record['title']: record for record in enriched}
+
+def fixture_tracks(downloads, count):
+    # Cycles the sample album until there are `count` tracks. Every pass is a
+    # separate album so batching and per-album art behave as they would on a
+    # real library.
+    tracks = []
+    for i in range(count):
+        sample = downloads[i % len(downloads)]
+        copy = i // len(downloads)
+        suffix = f" ({copy + 1})" if copy else ""
+        tracks.append({
+            'id': f"bench{i:05d}",
+            'title': sample['Track Title'] + suffix,
+            'album': sample['Album'] + suffix,
+            'artist': sample['Artist'],
+            'album_url': f"{sample['Album URL']}{copy}",
+            'sample_title': sample['Track Title'],
+        })
+    return tracks
+
+# --- yt-dlp stand-in ------------------------------------------------------
+
+class FakeYoutubeDL:
+    # Implements the small part of YoutubeDL the scripts use. Videos are looked
+    # up in `catalog` by id; downloads sleep for `download_latency` and write
+    # a silent MP3 where the real postprocessor would have left one.
+    catalog = {}
+    extract_latency = 0.0
+    download_latency = 0.0
+
+    def __init__(self, params=None):
+        self.params = dict(params or {})
+        outtmpl = self.params.get('outtmpl', '%(title)s.%(ext)s')
+        self.params['outtmpl'] = outtmpl if isinstance(outtmpl, dict) else {'default': outtmpl}
+
+    def extract_info(self, url, download=False, process=True):
+        time.sleep(self.extract_latency)
+        video_id = parse_qs(urlparse(url).query).get('v', [url])[0]
+        info = dict(self.catalog[video_id])
+        return self.process_ie_result(info, download) if download else info
+
+    def process_ie_result(self, ie_result, download=True):
+        if download:
+            time.sleep(self.download_latency)
+            path = self.params['outtmpl']['default'].replace('%(ext)s', 'mp3').replace('%%', '%')
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(MP3_FRAME * MP3_FRAMES)
+        return ie_result
+
+    def sanitize_info(self, info):
+        return info
+
+    def close(self):
+        pass
+
+def install_fake_ytdlp():
+    module = types.ModuleType('yt_dlp')
+    module.YoutubeDL = FakeYoutubeDL
+    sys.modules['yt_dlp'] = module
+
+# --- OpenAI stand-in ------------------------------------------------------
+
+class StubCompletions:
+    def __init__(self, fixtures, latency, latency_per_track):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.latency_per_track = latency_per_track
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def answer(self, track):
+        sample = self.fixtures.get(track.get('sample_title') or track.get('title'), {})
+        record = {key: value for key, value in sample.items() if key not in ('album art path', 'file_path', 'album_art_url')}
+        for key in ('composers', 'conductors'):
+            value = record.get(key) or ''
+            record[key] = [name.strip() for name in value.split(',') if name.strip()]
+        record.update({'title': track.get('title'), 'track_number': track.get('track_number'), 'spotify_album_art_url': ''})
+        return record
+
+    def create(self, model=None, messages=None, functions=None, function_call=None, **kwargs):
+        payload = json.loads(messages[-1]['content'])
+        tracks = payload.get('tracks')
+        time.sleep(self.latency + self.latency_per_track * len(tracks or [payload]))
+        with self._lock:
+            self.calls += 1
+
+        if tracks is None:
+            result = {**self.answer(payload), 'album': payload.get('album')}
+        else:
+            records = [self.answer(track) for track in tracks]
+            result = {'album': payload.get('album'), 'tracks': records}
+            if records:
+                result.update({k: records[0].get(k) for k in ('album_artist', 'year', 'genre', 'publisher', 'copyright')})
+        arguments = json.dumps(result)
+        message = types.SimpleNamespace(function_call=types.SimpleNamespace(arguments=arguments))
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+class StubOpenAI:
+    def __init__(self, completions):
+        self.chat = types.SimpleNamespace(completions=completions)
+
+# --- Thumbnail server -----------------------------------------------------
+
+def thumbnail_bytes():
+    # A gradient with some grain compresses roughly like real cover art.
+    from PIL import Image
+    gradient = Image.linear_gradient('L').resize((1280, 720))
+    grain = Image.effect_noise((1280, 720), 40)
+    img = Image.merge('RGB', [
+        Image.blend(gradient, grain, 0.3),
+        gradient.transpose(Image.FLIP_LEFT_RIGHT),
+        Image.blend(gradient.rotate(90).resize((1280, 720)), grain, 0.2),
+    ])
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=90)
+    return out.getvalue()
+
+@contextmanager
+def thumbnail_server():
+    data = thumbnail_bytes()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# --- Benchmark ------------------------------------------------------------
+
+def reset_state():
+    # Drop every per-process cache so each size starts cold.
+    import chat_gpt, crop_thumbnail, embed_metadata, extraction_cache, http_pool, job_journal, library_index, thumbnail_store
+    http_pool.close_pools()
+    extraction_cache.get_store.reset()
+    extraction_cache._key_locks.clear()
+    chat_gpt.get_metadata_cache.reset()
+    thumbnail_store.get_thumbnail_store.reset()
+    library_index.get_library.reset()
+    job_journal.get_journal.reset()
+    with crop_thumbnail._rendered_lock:
+        crop_thumbnail._rendered.clear()
+    with embed_metadata._art_cache_lock:
+        embed_metadata._art_cache.clear()
+
+@contextmanager
+def quiet(verbose):
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        yield
+
+def timed(results, stage, count, fn):
+    start = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - start
+    results[stage] = {
+        'seconds': round(seconds, 4),
+        'per_track_ms': round(seconds * 1000 / max(count, 1), 3),
+        'tracks_per_second': round(count / seconds, 2) if seconds else None,
+    }
+    return value
+
+def run_size(count, downloads, fixtures, base_url, args):
+    import chat_gpt
+    from download_song import download_playlist
+    from fetch_metadata import fetch_metadata
+    from crop_thumbnail import crop_thumbnail
+    from embed_metadata import embed_metadata
+    from thumbnail_store import THUMBNAIL_DIR
+
+    tracks = fixture_tracks(downloads, count)
+    FakeYoutubeDL.catalog = {
+        track['id']: {
+            'id': track['id'],
+            'title': track['title'],
+            'track': track['title'],
+            'album': track['album'],
+            'artist': track['artist'],
+            'thumbnail': f"{base_url}/vi/{track['id']}/maxresdefault.jpg",
+        }
+        for track in tracks
+    }
+    completions = StubCompletions(fixtures, args.llm_latency, args.llm_latency_per_track)
+    chat_gpt._default_client = StubOpenAI(completions)
+
+    stages = {}
+    workdir = tempfile.mkdtemp(prefix='ipod-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        reset_state()
+        with quiet(args.verbose):
+            urls = [f"https://www.youtube.com/watch?v={track['id']}" for track in tracks]
+            downloaded = timed(stages, 'download_song_with_metadata', count,
+                               lambda: download_playlist(urls, None, None, musicPath='music', concurrency=args.concurrency, on_progress=lambda event: None))
+            for track, metadata in zip(tracks, downloaded):
+                metadata['Album URL'] = track['album_url']
+
+            records = timed(stages, 'fetch_metadata', count,
+                            lambda: fetch_metadata(downloaded, concurrency=args.concurrency, thumbnail_format=args.thumbnail_format))
+
+            # Empty store again so the art stage measures download + render.
+            reset_state()
+            shutil.rmtree(THUMBNAIL_DIR, ignore_errors=True)
+            # One cover per album, as fetch_metadata prepares it.
+            art_urls = list({metadata['Album']: metadata['Thumbnail URL'] for metadata in reversed(downloaded)}.values())
+            timed(stages, 'crop_thumbnail', count,
+                  lambda: [crop_thumbnail(url, fmt=args.thumbnail_format) for url in art_urls])
+
+            results = timed(stages, 'embed_metadata', count, lambda: embed_metadata(records))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'tracks': count,
+        'downloaded': len(downloaded),
+        'tagged': sum(1 for result in results if result['ok']),
+        'llm_calls': completions.calls,
+        'thumbnails': len(art_urls),
+        'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4),
+        'stages': stages,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(report, baseline=None):
+    previous = {run['tracks']: run for run in (baseline or {}).get('runs', [])}
+    for run in report['runs']:
+        print(f"{run['tracks']} tracks ({run['total_seconds']:.2f}s, {run['llm_calls']} LLM calls)")
+        for stage in STAGES:
+            result = run['stages'][stage]
+            line = f"  {stage:<30} {result['seconds']:9.3f}s {result['per_track_ms']:10.2f}ms/track"
+            old = previous.get(run['tracks'], {}).get('stages', {}).get(stage)
+            if old and result['seconds']:
+                line += f"   {old['seconds'] / result['seconds']:.2f}x vs baseline"
+            print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against offline fixtures.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--thumbnail-format', choices=['png', 'jpeg'], default='png')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="seconds per stub OpenAI request")
+    parser.add_argument('--llm-latency-per-track', type=float, default=0.01, help="extra seconds per track in a request")
+    parser.add_argument('--extract-latency', type=float, default=0.0, help="seconds per fake yt-dlp extraction")
+    parser.add_argument('--download-latency', type=float, default=0.0, help="seconds per fake yt-dlp download")
+    parser.add_argument('--verbose', action='store_true', help="show the scripts' own output")
+    args = parser.parse_args()
+
+    install_fake_ytdlp()
+    FakeYoutubeDL.extract_latency = args.extract_latency
+    FakeYoutubeDL.download_latency = args.download_latency
+    downloads, fixtures = load_fixtures()
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'options': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'verbose')},
+        'runs': [],
+    }
+    with thumbnail_server() as base_url:
+        for count in args.sizes:
+            report['runs'].append(run_size(count, downloads, fixtures, base_url, args))
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    print(f"Results written to {args.output}")
@@ -18,92 +18,251 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import json
-from openai import OpenAI
-import json
+import hashlib
+import os
+import random
+import threading
+import time
+from cache_store import CACHE_DIR, CacheStore
+from store_utils import Lazy
+from http_pool import get_http_client
+import metrics
+
+CONFIG_PATH = "config.json"
+
+_default_client = None
+_default_client_lock = threading.Lock()
 
-with open("config.json") as f:
-    config = json.load(f)
+def get_default_client():
+    # Built on first use, so importing this module neither loads the OpenAI
+    # SDK nor needs config.json.
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            from openai import OpenAI
 
-openai_api_key = config["openai_credentials"]["api_key"]
-organization = config["openai_credentials"].get("organization")
-project_id = config["openai_credentials"].get("project_id")
+            with open(CONFIG_PATH) as f:
+                config = json.load(f)
 
-from openai import OpenAI
+            credentials = config["openai_credentials"]
+            _default_client = OpenAI(
+                api_key=credentials["api_key"],
+                organization=credentials.get("organization"),
+                project=credentials.get("project_id"),
+                http_client=get_http_client()
+            )
+        return _default_client
 
-client = OpenAI(
-    api_key=openai_api_key,
-    organization=organization,
-    project=project_id
-)
+FUNCTION_SCHEMA = {
+    "name": "fill_song_metadata",
+    "description": "Fill in the missing or incorrect metadata for the song details",
+    "parameters": {
+        "type": "object",
+        "required": [
+            "title", "subtitle", "rating", "comments", "contributing_artist",
+            "album_artist", "album", "year", "track_number", "genre", "length",
+            "bit_rate", "publisher", "encoded_by", "author_url", "copyright",
+            "parental_rating_reason", "composers", "conductors", "group_description",
+            "mood", "part_of_set", "initial_key", "beats_per_minute_bpm", "protected",
+            "part_of_compilation", "disc_number", "isrc", "album_art_url"
+        ],
+        "properties": {
+            "title": {"type": "string"},
+            "subtitle": {"type": "string"},
+            "rating": {"type": "number"},
+            "comments": {"type": "string"},
+            "contributing_artist": {"type": "string"},
+            "album_artist": {"type": "string"},
+            "album": {"type": "string"},
+            "year": {"type": "integer"},
+            "track_number": {"type": "integer"},
+            "disc_number": {"type": "integer"},
+            "isrc": {"type": "string"},
+            "spotify_url": { "type": "string" },
+            "spotify_album_art_url": { "type": "string" },
+            "genre": {"type": "string"},
+            "length": {"type": "string"},
+            "bit_rate": {"type": "number"},
+            "publisher": {"type": "string"},
+            "encoded_by": {"type": "string"},
+            "author_url": {"type": "string"},
+            "copyright": {"type": "string"},
+            "parental_rating_reason": {"type": "string"},
+            "composers": {
+                "type": "array",
+                "items": {"type": "string"}
+            },
+            "conductors": {
+                "type": "array",
+                "items": {"type": "string"}
+            },
+            "group_description": {"type": "string"},
+            "mood": {"type": "string"},
+            "part_of_set": {"type": "string"},
+            "initial_key": {"type": "string"},
+            "beats_per_minute_bpm": {"type": "number"},
+            "protected": {"type": "boolean"},
+            "part_of_compilation": {"type": "boolean"}
+        },
+        "additionalProperties": False
+    }
+}
+
+METADATA_FIELDS = FUNCTION_SCHEMA["parameters"]["required"]
+
+# Album-level fields are asked for once per album in batch mode and copied
+# onto every track; everything else is filled per track.
+ALBUM_FIELDS = ["album", "album_artist", "year", "genre", "publisher", "copyright"]
+
+def function_schema(fields=None) -> dict:
+    # FUNCTION_SCHEMA trimmed to `fields`, so the model is only asked for
+    # what is not already known locally. None means every field.
+    if fields is None:
+        return FUNCTION_SCHEMA
+    parameters = FUNCTION_SCHEMA["parameters"]
+    fields = [f for f in parameters["required"] if f in fields]
+    return {
+        **FUNCTION_SCHEMA,
+        "parameters": {
+            **parameters,
+            "required": fields,
+            "properties": {f: parameters["properties"][f] for f in fields if f in parameters["properties"]}
+        }
+    }
 
+def album_function_schema(fields=None) -> dict:
+    parameters = function_schema(fields)["parameters"]
+    properties = parameters["properties"]
+    album_fields = [f for f in ALBUM_FIELDS if f in parameters["required"]]
+    track_required = [f for f in parameters["required"] if f not in ALBUM_FIELDS]
+    track_properties = {k: v for k, v in properties.items() if k not in ALBUM_FIELDS}
 
-def get_all_metadata(input_metadata: dict, model="gpt-4o") -> dict:
-    function_schema = {
-        "name": "fill_song_metadata",
-        "description": "Fill in the missing or incorrect metadata for the song details",
+    return {
+        "name": "fill_album_metadata",
+        "description": "Fill in the missing or incorrect metadata for every song on the album",
         "parameters": {
             "type": "object",
-            "required": [
-                "title", "subtitle", "rating", "comments", "contributing_artist",
-                "album_artist", "album", "year", "track_number", "genre", "length",
-                "bit_rate", "publisher", "encoded_by", "author_url", "copyright",
-                "parental_rating_reason", "composers", "conductors", "group_description",
-                "mood", "part_of_set", "initial_key", "beats_per_minute_bpm", "protected",
-                "part_of_compilation", "disc_number", "isrc", "album_art_url"
-            ],
+            "required": album_fields + ["tracks"],
             "properties": {
-                "title": {"type": "string"},
-                "subtitle": {"type": "string"},
-                "rating": {"type": "number"},
-                "comments": {"type": "string"},
-                "contributing_artist": {"type": "string"},
-                "album_artist": {"type": "string"},
-                "album": {"type": "string"},
-                "year": {"type": "integer"},
-                "track_number": {"type": "integer"},
-                "disc_number": {"type": "integer"},
-                "isrc": {"type": "string"},
-                "spotify_url": { "type": "string" },
-                "spotify_album_art_url": { "type": "string" },
-                "genre": {"type": "string"},
-                "length": {"type": "string"},
-                "bit_rate": {"type": "number"},
-                "publisher": {"type": "string"},
-                "encoded_by": {"type": "string"},
-                "author_url": {"type": "string"},
-                "copyright": {"type": "string"},
-                "parental_rating_reason": {"type": "string"},
-                "composers": {
-                    "type": "array",
-                    "items": {"type": "string"}
-                },
-                "conductors": {
+                **{f: properties[f] for f in album_fields},
+                "tracks": {
                     "type": "array",
-                    "items": {"type": "string"}
-                },
-                "group_description": {"type": "string"},
-                "mood": {"type": "string"},
-                "part_of_set": {"type": "string"},
-                "initial_key": {"type": "string"},
-                "beats_per_minute_bpm": {"type": "number"},
-                "protected": {"type": "boolean"},
-                "part_of_compilation": {"type": "boolean"}
+                    "description": "One entry per input track, in the same order",
+                    "items": {
+                        "type": "object",
+                        "required": track_required,
+                        "properties": track_properties,
+                        "additionalProperties": False
+                    }
+                }
             },
             "additionalProperties": False
         }
     }
 
+# Bump whenever FUNCTION_SCHEMA, ALBUM_FIELDS or the prompts change so cached answers
+# produced for the old shape are never served again.
+METADATA_SCHEMA_VERSION = 1
+METADATA_CACHE_TTL = 30 * 24 * 60 * 60
+METADATA_CACHE_MAX_ENTRIES = 5000
+
+RATE_LIMIT_RETRIES = 5
+RATE_LIMIT_BASE_DELAY = 1.0
+
+get_metadata_cache = Lazy(lambda: CacheStore(
+    os.path.join(CACHE_DIR, 'metadata.sqlite'),
+    ttl=METADATA_CACHE_TTL,
+    max_entries=METADATA_CACHE_MAX_ENTRIES
+))
+
+def normalize_value(value):
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {k: normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(v) for v in value]
+    return value
+
+def metadata_cache_key(input_metadata: dict, model: str, fields=None) -> str:
+    # Answers to a trimmed schema are keyed by the fields asked for as well;
+    # full answers keep their original keys.
+    key = [METADATA_SCHEMA_VERSION, model, normalize_value(input_metadata)]
+    if fields is not None:
+        key.append(sorted(fields))
+    payload = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def album_tag(album) -> str:
+    return f"album:{normalize_value(album or '')}"
+
+def invalidate_album(album) -> int:
+    return get_metadata_cache().invalidate(album_tag(album))
+
+def metadata_cache_stats() -> dict:
+    return get_metadata_cache().stats()
+
+def is_rate_limited(error) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a music metadata assistant."},
-                {"role": "user", "content": "Fill in any missing or incorrect fields for this song metadata:"},
-                {"role": "user", "content": json.dumps(input_metadata)}
-            ],
-            functions=[function_schema],
-            function_call={"name": "fill_song_metadata"}
-        )
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def with_backoff(request, retries=RATE_LIMIT_RETRIES, base_delay=RATE_LIMIT_BASE_DELAY):
+    # Concurrent enrichment can trip the API rate limit. Wait and retry on 429s,
+    # honouring Retry-After when the server sends one, and re-raise anything else.
+    for attempt in range(retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == retries or not is_rate_limited(e):
+                raise
+            delay = retry_after(e) or base_delay * (2 ** attempt) * (1 + random.random())
+            metrics.count('llm_retries')
+            print(f"[WARN] Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+def cached_metadata(cache, input_metadata: dict, model: str, fields=None):
+    # An answer for exactly these fields, or else a full answer for the same
+    # input, which covers any subset.
+    cached = cache.get(metadata_cache_key(input_metadata, model, fields))
+    if cached is None and fields is not None:
+        cached = cache.get(metadata_cache_key(input_metadata, model))
+    return cached
+
+def get_all_metadata(input_metadata: dict, model="gpt-4o", use_cache=True, client=None, fields=None) -> dict:
+    # `fields` limits the request to those schema fields (see function_schema).
+    if use_cache:
+        cache_key = metadata_cache_key(input_metadata, model, fields)
+        cached = cached_metadata(get_metadata_cache(), input_metadata, model, fields)
+        if cached is not None:
+            return cached
+
+    metadata = request_all_metadata(input_metadata, model, client=client, fields=fields)
+    if use_cache and "error" not in metadata:
+        get_metadata_cache().put(cache_key, metadata, tag=album_tag(input_metadata.get("album")))
+    return metadata
+
+def request_all_metadata(input_metadata: dict, model="gpt-4o", client=None, fields=None) -> dict:
+    client = client or get_default_client()
+    schema = function_schema(fields)
+    try:
+        with metrics.span('llm_call', function=schema["name"]):
+            response = with_backoff(lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a music metadata assistant."},
+                    {"role": "user", "content": "Fill in any missing or incorrect fields for this song metadata:"},
+                    {"role": "user", "content": json.dumps(input_metadata)}
+                ],
+                functions=[schema],
+                function_call={"name": schema["name"]}
+            ))
 
         args_str = response.choices[0].message.function_call.arguments
         return json.loads(args_str)
@@ -112,7 +271,66 @@ def get_all_metadata(input_metadata: dict, model="gpt-4o") -> dict:
         print("Error in get_all_metadata:", e)
         return {"error": str(e)}
 
-    
+
+def get_album_metadata(album_metadata: dict, tracks: list, model="gpt-4o", use_cache=True, client=None, fields=None) -> list:
+    # Returns one filled record per input track (same order), or None for
+    # tracks the model left out so the caller can fall back to get_all_metadata.
+    cache = get_metadata_cache()
+    tag = album_tag(album_metadata.get("album"))
+    track_keys = [metadata_cache_key({**album_metadata, **track}, model, fields) for track in tracks]
+
+    if use_cache:
+        cached = [cached_metadata(cache, {**album_metadata, **track}, model, fields) for track in tracks]
+        if all(record is not None for record in cached):
+            return cached
+
+    response = request_album_metadata(album_metadata, tracks, model, client=client, fields=fields)
+    if "error" in response:
+        return [None] * len(tracks)
+
+    shared = {f: response[f] for f in ALBUM_FIELDS if f in response}
+    returned = response.get("tracks") or []
+    if len(returned) != len(tracks):
+        # Fall back to matching on track number when the model drops or
+        # reorders entries.
+        by_number = {t.get("track_number"): t for t in returned}
+        returned = [by_number.get(track.get("track_number")) for track in tracks]
+
+    results = []
+    for key, record in zip(track_keys, returned):
+        if not record:
+            results.append(None)
+            continue
+        metadata = {**record, **shared}
+        if use_cache:
+            cache.put(key, metadata, tag=tag)
+        results.append(metadata)
+    return results
+
+def request_album_metadata(album_metadata: dict, tracks: list, model="gpt-4o", client=None, fields=None) -> dict:
+    client = client or get_default_client()
+    schema = album_function_schema(fields)
+
+    try:
+        with metrics.span('llm_call', function=schema["name"]):
+            response = with_backoff(lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": "You are a music metadata assistant."},
+                    {"role": "user", "content": "Fill in any missing or incorrect fields for every song on this album. Return one entry in tracks per input track, in the same order:"},
+                    {"role": "user", "content": json.dumps({**album_metadata, "tracks": tracks})}
+                ],
+                functions=[schema],
+                function_call={"name": schema["name"]}
+            ))
+
+        args_str = response.choices[0].message.function_call.arguments
+        return json.loads(args_str)
+
+    except Exception as e:
+        print("Error in get_album_metadata:", e)
+        return {"error": str(e)}
+
 # test_metadata = {
 #     "title": "Aquemini",
 #     "album_artist": "Outkast",
@@ -0,0 +1,129 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Import-time budget for the script entry points. main.js spawns these, so
+# whatever a module pulls in at import is paid on every cold start. Each
+# module is imported in a fresh interpreter under `python -X importtime` and
+# checked against a time budget, and against a list of heavy dependencies
+# that must only be loaded on first use.
+#
+#   python scripts/check_import_time.py            # check every budget
+#   python scripts/check_import_time.py --verbose  # also list the slowest imports
+
+import argparse
+import os
+import subprocess
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative import time budget per module, in milliseconds.
+BUDGETS_MS = {
+    'cache_store': 40,
+    'http_pool': 40,
+    'metrics': 40,
+    'thumbnail_store': 40,
+    'extraction_cache': 60,
+    'chat_gpt': 60,
+    'crop_thumbnail': 60,
+    'download_song': 80,
+    'get_track_url': 60,
+    'fetch_metadata': 100,
+    'embed_metadata': 150,
+    'pipeline': 200,
+    'worker': 200,
+}
+
+# Loaded lazily by the code that needs them; importing any script must not
+# pull these in.
+LAZY_MODULES = ['yt_dlp', 'openai', 'httpx', 'PIL', 'magic', 'requests']
+
+RUNS = 3
+
+def measure(module):
+    # Returns ([(name, depth, cumulative microseconds)] in the order Python
+    # reports them, module's own cumulative microseconds) for one cold import.
+    code = f"import sys; sys.path.insert(0, {SCRIPTS_DIR!r}); import {module}"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append((name.strip(), depth, int(cumulative)))
+    total = next((us for name, depth, us in timings if name == module and depth == 0), 0)
+    return timings, total
+
+def direct_imports(timings, module):
+    # Python lists an import's children just before the import itself, one
+    # level deeper.
+    names = [name for name, _, _ in timings]
+    index = names.index(module)
+    children = []
+    for name, depth, us in reversed(timings[:index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, us))
+    return children
+
+def check(module, budget_ms, verbose=False):
+    # Best of RUNS so a busy machine does not fail the check.
+    runs = [measure(module) for _ in range(RUNS)]
+    timings, total_us = min(runs, key=lambda run: run[1])
+    total_ms = total_us / 1000
+
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"{total_ms:.1f}ms exceeds budget of {budget_ms}ms")
+    imported = {name for name, _, _ in timings}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        problems.append(f"imports {', '.join(eager)} eagerly")
+
+    status = 'FAIL' if problems else 'ok'
+    print(f"[{status}] {module}: {total_ms:.1f}ms / {budget_ms}ms" + (f" ({'; '.join(problems)})" if problems else ''))
+    if verbose:
+        for name, us in sorted(direct_imports(timings, module), key=lambda item: -item[1])[:5]:
+            print(f"        {us / 1000:8.1f}ms  {name}")
+    return not problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check script import times against their budgets.")
+    parser.add_argument('modules', nargs='*', help="modules to check (default: all with a budget)")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    ok = True
+    for module in args.modules or BUDGETS_MS:
+        try:
+            ok = check(module, BUDGETS_MS.get(module, min(BUDGETS_MS.values())), args.verbose) and ok
+        except RuntimeError as e:
+            print(f"[FAIL] {e}")
+            ok = False
+    sys.exit(0 if ok else 1)
@@ -18,14 +18,48 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import requests
-from PIL import Image
 from io import BytesIO
-import os
+import threading
+from collections import OrderedDict
+from thumbnail_store import content_digest, get_thumbnail_store
+from http_pool import HTTP_TIMEOUT, get_session
+import metrics
 
-def crop_thumbnail(url, save_path, album, size=544):
-    response = requests.get(url)
-    img = Image.open(BytesIO(response.content)).convert("RGB")
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+JPEG_QUALITY = 90
+FORMATS = {'png': ('PNG', 'png'), 'jpeg': ('JPEG', 'jpg')}
+
+# Encoded thumbnails rendered or loaded by this process, keyed by their path in
+# the thumbnail store, so the embedder can skip reading them back.
+RENDERED_CACHE_SIZE = 32
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
+
+def download_image(url, max_bytes=MAX_DOWNLOAD_BYTES, timeout=HTTP_TIMEOUT):
+    with get_session().get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Thumbnail is {length} bytes, limit is {max_bytes}")
+
+        data = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            data.extend(chunk)
+            if len(data) > max_bytes:
+                raise ValueError(f"Thumbnail exceeds {max_bytes} bytes")
+    metrics.count('bytes_downloaded', len(data), source='thumbnail')
+    return bytes(data)
+
+def render_thumbnail(image_data, size=544, fmt='png'):
+    from PIL import Image
+
+    img = Image.open(BytesIO(image_data))
+
+    # JPEG sources can be decoded at 1/2, 1/4 or 1/8 scale straight away, as
+    # long as the result still covers the target size. No-op for other formats.
+    img.draft('RGB', (size, size))
+    img = img.convert("RGB")
 
     # Get image size
     width, height = img.size
@@ -34,19 +68,57 @@ def crop_thumbnail(url, save_path, album, size=544):
     new_side = min(width, height)
     left = (width - new_side) // 2
     top = (height - new_side) // 2
-    right = left + new_side
-    bottom = top + new_side
+    box = (left, top, left + new_side, top + new_side)
+
+    # Crop and resize to size x size. reducing_gap lets Pillow shrink with a
+    # cheap integer reduce() first and only run LANCZOS on the last step.
+    img_cropped = img.resize((size, size), Image.LANCZOS, box=box, reducing_gap=2.0)
+
+    out = BytesIO()
+    if fmt == 'jpeg':
+        # Baseline (non-progressive) JPEG: much smaller APIC frames than PNG
+        # and the only kind the iPod decodes reliably.
+        img_cropped.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=False)
+    else:
+        img_cropped.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+def remember_rendered(filename, data, digest):
+    with _rendered_lock:
+        _rendered[filename] = (data, digest)
+        _rendered.move_to_end(filename)
+        while len(_rendered) > RENDERED_CACHE_SIZE:
+            _rendered.popitem(last=False)
 
-    # Crop and resize to 544x544
-    img_cropped = img.crop((left, top, right, bottom)).resize((size, size), Image.LANCZOS)
+def get_rendered_thumbnail(filename):
+    # (bytes, sha256) of the thumbnail held in memory for filename, or None.
+    with _rendered_lock:
+        return _rendered.get(filename)
 
-    # Save to path
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    filename = f"{save_path}{album}.png"
-    img_cropped.save(filename, format="PNG")
+def crop_thumbnail(url, size=544, fmt='png', persist=True):
+    # Returns (filename, encoded bytes) for the thumbnail of `url`. Sources seen
+    # before are served from the thumbnail store without any network access.
+    # With persist=False a new render is only handed over in memory.
+    store = get_thumbnail_store()
+    filename = store.lookup(url, size, fmt)
+    if filename is not None:
+        data, digest = store.read(filename)
+        print(f"Using stored thumbnail {filename}")
+    else:
+        with metrics.span('thumbnail_fetch'):
+            image_data = download_image(url)
+        with metrics.span('crop', format=fmt):
+            data = render_thumbnail(image_data, size, fmt)
+        if persist:
+            filename, digest = store.add(url, size, fmt, FORMATS[fmt][1], data)
+            print(f"Saved cropped thumbnail to {filename}")
+        else:
+            digest = content_digest(data)
+            filename = store.path_for(digest, FORMATS[fmt][1])
 
-    print(f"Saved cropped thumbnail to {save_path}")
+    remember_rendered(filename, data, digest)
+    return filename, data
 
 # Example usage:
 # thumbnail_url = "https://i.ytimg.com/vi_webp/AhIn3zo3UT0/maxresdefault.webp"
-# crop_thumbnail(thumbnail_url, "assets/bin/thumbnails/", "Tungsten")
+# filename, data = crop_thumbnail(thumbnail_url)
@@ -18,11 +18,68 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import os
 import re
 import sys
-import yt_dlp
 import json
+import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from extraction_cache import extract_info, iter_entries
+from http_pool import borrow_ytdlp
+from job_journal import get_journal
+from library_index import get_library, video_id
+from track_title import clean_track_title
+import metrics
+
+DEFAULT_CONCURRENCY = 4
+
+# Output profiles:
+#   mp3      best audio stream, transcoded to 192k MP3 (the original behaviour)
+#   aac      YouTube's AAC (m4a) stream, remuxed into .m4a without re-encoding;
+#            iPods play AAC natively. Falls back to an AAC transcode when no
+#            AAC stream exists.
+#   mp3-min  smallest stream that still meets TARGET_BITRATE, transcoded to
+#            MP3 at that bitrate, so less is downloaded and decoded
+PROFILES = ['mp3', 'aac', 'mp3-min']
+DEFAULT_PROFILE = 'mp3'
+TARGET_BITRATE = 160
+
+def profile_ext(profile):
+    return 'm4a' if profile == 'aac' else 'mp3'
+
+# Download tuning. A single YouTube connection is throttled well below line
+# speed, which makes hour-long mixes crawl, so streams are fetched over
+# several connections: fragmented (DASH/HLS) streams several fragments at a
+# time, progressive ones in ranged chunks, or split across connections by
+# aria2c when it is installed. Partial .part files are resumed on the next
+# attempt. Any key can be overridden in the "download" section of config.json.
+DOWNLOAD_TUNING = {
+    'fragment_concurrency': 4,
+    'chunk_size': 10 * 1024 * 1024,
+    'aria2c': True,
+    'aria2c_connections': 8,
+    'aria2c_min_split_size': '1M',
+}
+CONFIG_PATH = 'config.json'
+
+_download_tuning = None
+
+def download_tuning():
+    global _download_tuning
+    if _download_tuning is None:
+        tuning = dict(DOWNLOAD_TUNING)
+        try:
+            with open(CONFIG_PATH, encoding='utf-8') as f:
+                tuning.update(json.load(f).get('download') or {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            eprint(f"[WARN] Ignoring download settings in {CONFIG_PATH}: {e}")
+        _download_tuning = tuning
+    return _download_tuning
 
 def patch_url_for_regular_youtube(url):
         if "music.youtube.com" in url:
@@ -50,108 +107,262 @@ def getCookies(service):
     return 'scripts/cookies_youtubemusic.txt'
 
 def getLinks(url):
+    # Yields playlist links as yt-dlp pages through the playlist, so the first
+    # downloads start before the rest of a large playlist is enumerated.
     eprint(f"[DEBUG] Getting playlist links from: {url}")
     if 'music.youtube.com' in url:
         url = url.replace('music.youtube.com', 'www.youtube.com')
 
-    ydl_opts = {
-        'extract_flat': 'in_playlist',
-        'quiet': True,
-        'skip_download': True,
-        'force_generic_extractor': False,
-    }
-
-    urls = []
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info_dict = ydl.extract_info(url, download=False)
-        eprint(f"[DEBUG] Extracted playlist info")
+    for entry in iter_entries(url):
+        eprint(f"[DEBUG] Found entry: {entry.get('url', 'N/A')}")
+        yield entry['url']
 
-        if 'entries' in info_dict:
-            for entry in info_dict['entries']:
-                eprint(f"[DEBUG] Found entry: {entry.get('url', 'N/A')}")
-                urls.append(entry['url'])
-    return urls
+def download_song(url, playlistUrl, thumbnailUrl, service, media, concurrency=DEFAULT_CONCURRENCY, on_progress=None, job=None, profile=DEFAULT_PROFILE):
+    eprint(f"[DOWNLOAD] URL: {url} | Service: {service} | Media: {media}")
+    cookies = getCookies(service)
+    return download_media(url, playlistUrl, thumbnailUrl, service, media, cookies, concurrency, on_progress, job, profile)
 
-def download_song(url, playlistUrl, thumbnailUrl, service, media):
+def stream_song(url, playlistUrl, thumbnailUrl, service, media, concurrency=DEFAULT_CONCURRENCY, on_progress=None, job=None, profile=DEFAULT_PROFILE):
+    # Same inputs as download_song, but yields each track's metadata as soon
+    # as that track is on disk so later stages can start on it.
     eprint(f"[DOWNLOAD] URL: {url} | Service: {service} | Media: {media}")
     cookies = getCookies(service)
+    if media != 'track' and "list=" in url:
+        playlist = getLinks(url)
+        for _, song_url, metadata in iter_playlist_downloads(playlist, thumbnailUrl, cookies, musicPath='music', concurrency=concurrency, on_progress=on_progress, job=job, profile=profile, playlistUrl=url):
+            if metadata:
+                yield metadata
+            else:
+                eprint(f"[WARN] Failed to download metadata for: {song_url}")
+    else:
+        for metadata in download_media(url, playlistUrl, thumbnailUrl, service, media, cookies, concurrency, on_progress, job, profile):
+            if metadata:
+                yield metadata
 
+def download_media(url, playlistUrl, thumbnailUrl, service, media, cookies, concurrency, on_progress, job=None, profile=DEFAULT_PROFILE):
     metadata_list = []
 
     if media == 'track' and service != 'youtube_music':
-        metadata = download_song_with_metadata(url, playlistUrl,  cookies_file_path=cookies, musicPath='music')
+        metadata = journaled_download(job, 1, url, lambda: download_song_with_metadata(url, playlistUrl,  cookies_file_path=cookies, musicPath='music', profile=profile))
         metadata_list.append(metadata)
     elif media == 'track' and service == 'youtube_music':
-        metadata = download_song_with_metadata(url, playlistUrl, cookies_file_path=cookies, musicPath='music')
+        metadata = journaled_download(job, 1, url, lambda: download_song_with_metadata(url, playlistUrl, cookies_file_path=cookies, musicPath='music', profile=profile))
         metadata_list.append(metadata)
     elif "list=" not in url:
-        metadata = download_song_with_metadata(url, playlistUrl, thumbnailUrl, cookies_file_path=cookies, musicPath='music')
+        metadata = journaled_download(job, 1, url, lambda: download_song_with_metadata(url, playlistUrl, thumbnailUrl, cookies_file_path=cookies, musicPath='music', profile=profile))
         metadata_list.append(metadata)
     elif "list=" in url:
         playlist = getLinks(url)
-        track_number = 1
-        for song_url in playlist:
-            eprint(f"[DEBUG] Downloading track #{track_number}: {song_url}")
-            metadata = download_song_with_metadata(song_url, playlist, thumbnailUrl, cookies_file_path=cookies, musicPath='music', index=track_number)
-            if metadata:
-                metadata_list.append(metadata)
-            else:
-                eprint(f"[WARN] Failed to download metadata for: {song_url}")
-            track_number += 1
+        metadata_list = download_playlist(playlist, thumbnailUrl, cookies, musicPath='music', concurrency=concurrency, on_progress=on_progress, job=job, profile=profile, playlistUrl=url)
 
     return metadata_list  # Final metadata list for internal Python or JSON output
 
+def journaled_download(job, track_number, url, download):
+    # Hands back a track an earlier run of the same job already downloaded
+    # (from the same video, with its file unchanged); otherwise downloads it
+    # and records it.
+    source = video_id(url) or url
+    if job is not None:
+        metadata = job.completed(track_number, 'downloaded', source=source)
+        if metadata:
+            eprint(f"[INFO] Track #{track_number} already downloaded, resuming from the job journal")
+            return metadata
+
+    metadata = download()
+    if job is not None and metadata:
+        job.record(track_number, 'downloaded', metadata, metadata['File Path'], source=source)
+    return metadata
+
+def emit_progress(event):
+    eprint(f"[PROGRESS] {json.dumps(event)}")
+
+def iter_playlist_downloads(playlist, thumbnailUrl, cookies, musicPath='music', concurrency=DEFAULT_CONCURRENCY, on_progress=None, job=None, profile=DEFAULT_PROFILE, playlistUrl=None):
+    # Yields (track_number, song_url, metadata) as each track finishes, which is
+    # not necessarily playlist order. metadata is None for failed tracks.
+    # `playlist` may be a generator (see getLinks): links are consumed only
+    # a couple per worker ahead of the downloads, so memory stays bounded
+    # however long the playlist is, and "total" is None when it is unknown.
+    on_progress = on_progress or emit_progress
+    total = len(playlist) if hasattr(playlist, '__len__') else None
+    if total == 0:
+        return
+
+    def download_track(track_number, song_url):
+        eprint(f"[DEBUG] Downloading track #{track_number}: {song_url}")
+        on_progress({"event": "started", "track_number": track_number, "total": total, "url": song_url})
+        try:
+            metadata = journaled_download(job, track_number, song_url, lambda: download_song_with_metadata(song_url, playlistUrl, thumbnailUrl, cookies_file_path=cookies, musicPath=musicPath, index=track_number, profile=profile))
+        except Exception as e:
+            eprint(f"[ERROR] Track #{track_number} failed: {e}")
+            metadata = None
+        event = {"event": "finished" if metadata else "failed", "track_number": track_number, "total": total, "url": song_url}
+        transfer = take_transfer()
+        if transfer and metadata:
+            event.update(transfer)
+        on_progress(event)
+        return track_number, song_url, metadata
+
+    workers = max(1, concurrency if total is None else min(concurrency, total))
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for track_number, song_url in enumerate(playlist, start=1):
+            pending.add(pool.submit(download_track, track_number, song_url))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+def download_playlist(playlist, thumbnailUrl, cookies, musicPath='music', concurrency=DEFAULT_CONCURRENCY, on_progress=None, job=None, profile=DEFAULT_PROFILE, playlistUrl=None):
+    # Track numbers come from playlist position, so sorting on them gives the
+    # same list no matter which worker finishes first.
+    results = sorted(
+        iter_playlist_downloads(playlist, thumbnailUrl, cookies, musicPath, concurrency, on_progress, job, profile, playlistUrl),
+        key=lambda result: result[0]
+    )
+
+    metadata_list = []
+    for _, song_url, metadata in results:
+        if metadata:
+            metadata_list.append(metadata)
+        else:
+            eprint(f"[WARN] Failed to download metadata for: {song_url}")
+    return metadata_list
+
 def sanitize_filename(filename: str) -> str:
     return re.sub(r'[\\/:"*?<>|]+', '-', filename).strip()
 
-def get_playlist_dict(url):
-        ydl_opts_info = {}
-
-        # Extract metadata first
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
+# yt-dlp calls both hooks on the thread doing the download, so postprocessor
+# start times and the last transfer are kept per thread.
+_postprocessor_local = threading.local()
+_transfer_local = threading.local()
+
+def record_download_progress(progress):
+    if progress.get('status') == 'finished':
+        size = progress.get('total_bytes') or progress.get('downloaded_bytes') or 0
+        metrics.count('bytes_downloaded', size, source='audio')
+        elapsed = progress.get('elapsed')
+        if elapsed:
+            # bytes_downloaded over transfer seconds gives the throughput.
+            metrics.record_span('transfer', elapsed)
+            _transfer_local.last = {"bytes": size, "seconds": round(elapsed, 3)}
+            eprint(f"[INFO] Downloaded {size / 1048576:.1f} MiB in {elapsed:.1f}s ({size / 1048576 / elapsed:.2f} MiB/s)")
+
+def take_transfer():
+    # Size and duration of the last stream this thread downloaded, if any,
+    # cleared so a track served from the library does not report it again.
+    transfer = getattr(_transfer_local, 'last', None)
+    _transfer_local.last = None
+    return transfer
+
+def record_postprocessor(progress):
+    if not hasattr(_postprocessor_local, 'started'):
+        _postprocessor_local.started = {}
+    name = progress.get('postprocessor')
+    if progress.get('status') == 'started':
+        _postprocessor_local.started[name] = time.perf_counter()
+    elif progress.get('status') == 'finished':
+        started = _postprocessor_local.started.pop(name, None)
+        if started is not None:
+            metrics.record_span('transcode', time.perf_counter() - started, postprocessor=name)
+
+def download_opts(cookies_file_path=None, profile=DEFAULT_PROFILE):
+    if profile == 'aac':
+        # FFmpegExtractAudio stream-copies when the source is already AAC.
+        audio_format = 'bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best'
+        extract_audio = {'preferredcodec': 'm4a'}
+    elif profile == 'mp3-min':
+        audio_format = f'worstaudio[abr>={TARGET_BITRATE}]/bestaudio/best'
+        extract_audio = {'preferredcodec': 'mp3', 'preferredquality': str(TARGET_BITRATE)}
+    else:
+        audio_format = 'bestaudio/best'
+        extract_audio = {'preferredcodec': 'mp3', 'preferredquality': '192'}
+
+    ydl_opts_download = {
+        'format': audio_format,
+        'outtmpl': '%(title)s.%(ext)s',
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            **extract_audio,
+            'nopostoverwrites': False
+        }],
+        'progress_hooks': [record_download_progress],
+        'postprocessor_hooks': [record_postprocessor],
+        **tuning_opts(),
+    }
+    if cookies_file_path:
+        ydl_opts_download['cookiefile'] = cookies_file_path
+    return ydl_opts_download
+
+def tuning_opts():
+    tuning = download_tuning()
+    opts = {
+        'concurrent_fragment_downloads': max(1, int(tuning['fragment_concurrency'])),
+        'http_chunk_size': int(tuning['chunk_size']) or None,
+        'continuedl': True,
+        'nopart': False,
+    }
+    if tuning['aria2c'] and shutil.which('aria2c'):
+        # Fragmented streams stay with the native downloader, which already
+        # fetches them concurrently.
+        connections = str(tuning['aria2c_connections'])
+        opts['external_downloader'] = {'http': 'aria2c'}
+        opts['external_downloader_args'] = {'aria2c': [
+            '--max-connection-per-server', connections,
+            '--split', connections,
+            '--min-split-size', str(tuning['aria2c_min_split_size']),
+        ]}
+    return opts
+
+def borrow_downloader(cookies_file_path=None, profile=DEFAULT_PROFILE):
+    # Downloaders come from the process-wide pool, so a batch (and every later
+    # request to the worker) reuses the same instances and their connections.
+    return borrow_ytdlp(download_opts(cookies_file_path, profile))
 
-        {
-            'quiet': True,
-            'extract_flat': True,
-            'force_generic_extractor': True,
-        }
+def get_playlist_dict(url):
+        # Only the playlist title and its first entry are read, so the flat
+        # listing is enough; a full extraction would resolve every video.
+        return extract_info(url, mode='flat')
 
-        return info_dict
+def entry_thumbnail(entry):
+    # Flat entries carry a thumbnails list rather than a chosen thumbnail.
+    thumbnails = entry.get('thumbnails') or [{}]
+    return entry.get('thumbnail') or thumbnails[-1].get('url', 'N/A')
 
-def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True, cookies_file_path=None, musicPath=None, index=1):
+def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True, cookies_file_path=None, musicPath=None, index=1, profile=DEFAULT_PROFILE):
     eprint(f"[INFO] Fetching metadata from: {url}")
     if 'music.youtube.com' in url:
         url = url.replace('music.youtube.com', 'www.youtube.com')
 
+    # Tracks already on disk are handed back from the library index, first by
+    # video ID (no network at all), then by ISRC once the page is resolved.
+    library = get_library()
+    ext = profile_ext(profile)
+    known = library.lookup(video_id(url))
+    if known is not None and known["File Path"].endswith(f".{ext}"):
+        return from_library(known, index, musicPath)
+
     try:
-        ydl_opts_info = {}
-        if cookies_file_path:
-            ydl_opts_info['cookiefile'] = cookies_file_path
-
-        # Extract metadata first
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-            raw_title = info_dict.get('title', 'unknown')
+        with borrow_downloader(cookies_file_path, profile) as ydl:
+            # Resolve the page once; the unprocessed result names the file and is
+            # then handed straight to format selection and download.
+            with metrics.span('extract', mode='track'):
+                ie_result = ydl.extract_info(url, download=False, process=False)
+            known = library.lookup_isrc(ie_result.get('isrc'))
+            if known is not None and known["File Path"].endswith(f".{ext}"):
+                return from_library(known, index, musicPath)
+            raw_title = ie_result.get('title', 'unknown')
             safe_title = sanitize_filename(raw_title)
 
-        output_filename = f"{musicPath}/{index:02d} - {safe_title}.%(ext)s"
-
-        ydl_opts_download = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_filename,
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-                'nopostoverwrites': False
-            }],
-        }
-        if cookies_file_path:
-            ydl_opts_download['cookiefile'] = cookies_file_path
-
-        with yt_dlp.YoutubeDL(ydl_opts_download) as ydl:
-            ydl.download([url])
+            output_name = f"{musicPath}/{index:02d} - {safe_title}".replace('%', '%%')
+            ydl.params['outtmpl']['default'] = f"{output_name}.%(ext)s"
+            # Covers the audio download and the mp3 transcode (also timed on its own).
+            with metrics.span('download'):
+                info_dict = ydl.process_ie_result(ie_result, download=True)
+            downloaded_id = info_dict.get('id') or video_id(url)
+            downloaded_isrc = info_dict.get('isrc')
 
     except Exception as e:
         eprint(f"[ERROR] {e}")
@@ -164,7 +375,8 @@ def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True,
             "some formats may be missing"
         ]):
             eprint("[INFO] Retry without cookies due to error.")
-            return download_song_with_metadata(url, retry=False, cookies_file_path=None, musicPath=musicPath, index=index)
+            metrics.count('download_retries')
+            return download_song_with_metadata(url, playlistUrl, thumbnailUrl, retry=False, cookies_file_path=None, musicPath=musicPath, index=index, profile=profile)
 
         # If already retried or other error, give up
         return None
@@ -178,8 +390,9 @@ def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True,
         "Artist": info_dict.get('artist', 'N/A'),
         "Track Title": info_dict.get('track', raw_title),
         "Track Number": index,
-        "File Path": f"{musicPath}/{index:02d} - {safe_title}.mp3",
-        "Service": "youtube_music"  # or set dynamically if you want
+        "File Path": f"{musicPath}/{index:02d} - {safe_title}.{ext}",
+        "Service": "youtube_music",  # or set dynamically if you want
+        "Music Metadata": True
     }
 
     keys_to_check = ["Thumbnail URL", "Album", "Artist", "Track Title"]
@@ -191,18 +404,25 @@ def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True,
             "Artist": info_dict.get('channel', ['N/A']),
             "Track Title": clean_track_title(info_dict.get('title', 'N/A')),
             "Track Number": index,
-            "File Path": f"{musicPath}/{index:02d} - {sanitize_filename(info_dict.get('title', 'unknown'))}.mp3",
-            "Service": "youtube_music"
+            "File Path": f"{musicPath}/{index:02d} - {sanitize_filename(info_dict.get('title', 'unknown'))}.{ext}",
+            "Service": "youtube_music",
+            "Music Metadata": False
         }
 
+    # Passed on to fetch_metadata, which trusts title/album/artist only when
+    # "Music Metadata" says they came from YouTube Music's own track fields.
+    metadata["Release Year"] = info_dict.get('release_year')
+    metadata["Duration"] = info_dict.get('duration')
+
     keys_to_check = ["Thumbnail URL", "Album", "Artist", "Track Title"]
 
     if has_na({k: metadata[k] for k in keys_to_check}) and playlistUrl:
         info_dict = get_playlist_dict(playlistUrl)
+        first = info_dict['entries'][0]
         metadata.update({
-            "Thumbnail URL": thumbnailUrl if thumbnailUrl is not None else info_dict['entries'][0]['thumbnail'],
-            "Album": info_dict['entries'][0]['playlist'],
-            "Artist": info_dict['entries'][0]['uploader'],
+            "Thumbnail URL": thumbnailUrl if thumbnailUrl is not None else entry_thumbnail(first),
+            "Album": first.get('playlist') or info_dict['title'],
+            "Artist": first.get('uploader') or first.get('channel') or info_dict.get('uploader', 'N/A'),
             "Track Title": info_dict['title'],
             "Service": "youtube_music"
         })
@@ -211,17 +431,23 @@ def download_song_with_metadata(url, playlistUrl, thumbnailUrl=None, retry=True,
     for key, value in metadata.items():
         eprint(f"  {key}: {value}")
 
+    library.add(downloaded_id, metadata["File Path"], metadata, isrc=downloaded_isrc)
     return metadata
 
-
-def clean_track_title(title):
-    if not title or title == 'N/A':
-        return 'N/A'
-    title = re.sub(r'\s*[\(\[].*?(official|audio|video|lyrics?|HD|4K).*?[\)\]]', '', title, flags=re.IGNORECASE)
-    if ' - ' in title:
-        title = title.split(' - ', 1)[1]
-    title = re.sub(r'\s*[\(\[]\s*(?!feat\.|ft\.)[^)\]]*[\)\]]', '', title, flags=re.IGNORECASE)
-    return title.strip()
+def from_library(metadata, index, musicPath):
+    # The library copy is tagged for whichever album downloaded it first, and
+    # the caller re-tags what it gets back, so this track gets its own
+    # "NN - title" copy instead of sharing (and overwriting) that file. A
+    # full copy, not a hard link: tagging rewrites the file in place.
+    source = metadata['File Path']
+    name = os.path.basename(source).split(' - ', 1)[-1]
+    target = f"{musicPath}/{index:02d} - {name}"
+    if os.path.abspath(target) != os.path.abspath(source):
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        shutil.copyfile(source, target)
+    eprint(f"[INFO] Already downloaded as {source}, using {target}")
+    metrics.count('library_hits')
+    return {**metadata, "Track Number": index, "File Path": target}
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -233,8 +459,13 @@ if __name__ == "__main__":
     thumbnailUrl = sys.argv[3]
     service = sys.argv[4]
     media = sys.argv[5]
+    concurrency = int(sys.argv[6]) if len(sys.argv) > 6 else DEFAULT_CONCURRENCY
+    profile = sys.argv[7] if len(sys.argv) > 7 else DEFAULT_PROFILE
 
-    metadata_list = download_song(url, playlistUrl, thumbnailUrl, service, media)
+    # Re-running the same link resumes the tracks an earlier run finished.
+    job = get_journal().start(url, service, media, profile=profile)
+    metadata_list = download_song(url, playlistUrl, thumbnailUrl, service, media, concurrency=concurrency, job=job, profile=profile)
+    job.finish()
     for track in metadata_list:
         if track:
             track["Album URL"] = playlistUrl
@@ -19,207 +19,511 @@
 # SOFTWARE.
 
 import json
-from os import error
+import hashlib
+import os
 import sys
 import io
+import threading
+import time
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from mutagen.mp3 import MP3
-from io import BytesIO
-import requests
-import magic
+from mutagen.mp4 import MP4, MP4Cover, MP4FreeForm
 from mutagen.id3 import (
     TXXX, COMM, TPUB, TENC, WCOP, TCOP, TCOM, TPE3,
     TMOO, TPOS, TKEY, TBPM, TCMP, TSST, POPM, TPE2, TRCK,
-    TPOS, TLEN, TBPM, TSRC, ID3, TIT2, TPE1, TALB, TDRC, TCON, APIC, Encoding 
+    TPOS, TLEN, TBPM, TSRC, ID3, TIT2, TPE1, TALB, TDRC, TCON, APIC, Encoding, ID3NoHeaderError
 )
-
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-
-def embed_metadata(metadata_list):
+from audio_format import id3_tag_size, is_mp4
+import metrics
+
+# Padding left after the tag so a later re-tag fits in place instead of
+# making mutagen rewrite the whole file.
+DEFAULT_PADDING = 16 * 1024
+MAX_PADDING = 64 * 1024
+
+def tag_padding(info):
+    # Reuse the existing padding while the new tag still fits; only when it
+    # doesn't (or the padding is oversized) pick a fresh amount.
+    if 0 <= info.padding <= MAX_PADDING:
+        return info.padding
+    return DEFAULT_PADDING
+
+def embed_metadata(metadata_list, incremental=False):
     songs = metadata_list
     print("Raw input received from stdin:")
     print(repr(songs))  # This will show you exactly what's being passed
     tracks = songs
 
-    for track in tracks:
-        title = track["title"]
-        subtitle = track["subtitle"]
-        rating = track["rating"]
-        comments = track["comments"]
-        contributing_artist = track["contributing_artist"]
-        album_artist = track["album_artist"]
-        album = track["album"]
-        year = track["year"]
-        track_number = track["track_number"]
-        disc_number = track["disc_number"]
-        genre = track["genre"]
-        length = track["length"]
-        bit_rate = track["bit_rate"]
-        publisher = track["publisher"]
-        encoded_by = track["encoded_by"]
-        author_url = track["author_url"]
-        copyright = track["copyright"]
-        parental_rating_reason = track["parental_rating_reason"]
-        composers = track["composers"]
-        conductors = track["conductors"]
-        group_description = track["group_description"]
-        mood = track["mood"]
-        part_of_set = track["part_of_set"]
-        initial_key = track["initial_key"]
-        beats_per_minute_bpm = track["beats_per_minute_bpm"]
-        protected = track["protected"]
-        part_of_compilation = track["part_of_compilation"]
-        isrc = track["isrc"]
-        album_art_path = track["album art path"] 
-        file_path = track["file_path"]
-
-        try:
-            audio = MP3(file_path, ID3=ID3)  # Make sure ID3 is correctly imported at the top
-        except Exception as e:
-            print(f"Error loading MP3 file: {e}")
-            return
+    # A file that fails is reported and skipped; the rest of the batch still runs.
+    return [embed_track(track, incremental) for track in tracks]
+
+def embed_metadata_parallel(metadata_list, workers=None, incremental=False):
+    # Tags files across a process pool. Work is handed out in chunks that
+    # never mix album art, so each process reads a cover once per chunk; an
+    # album is still split into up to `workers` chunks so a single album keeps
+    # every process busy. Returns the per-file results plus totals.
+    tracks = list(metadata_list)
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or len(tracks) <= 1:
+        results = [tag_file(track, incremental) for track in tracks]
+    else:
+        chunks = art_chunks(tracks, workers)
+        results = [None] * len(tracks)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for indexes, (chunk_results, worker_metrics) in zip(chunks, pool.map(tag_chunk, [[tracks[i] for i in indexes] for indexes in chunks], [incremental] * len(chunks))):
+                # Spans recorded in the worker would otherwise never reach
+                # this process's snapshot or Prometheus file.
+                metrics.merge(worker_metrics)
+                for i, result in zip(indexes, chunk_results):
+                    results[i] = result
+
+    return {
+        "results": results,
+        "succeeded": sum(1 for result in results if result["ok"]),
+        "failed": sum(1 for result in results if not result["ok"]),
+        "skipped": sum(1 for result in results if result["skipped"]),
+        "bytes_written": sum(result["bytes_written"] for result in results),
+        "seconds": time.perf_counter() - started
+    }
+
+def art_chunks(tracks, workers):
+    # Lists of track indexes: grouped by album art path, each group split
+    # into at most `workers` chunks of consecutive tracks.
+    groups = {}
+    for i, track in enumerate(tracks):
+        groups.setdefault(track.get("album art path"), []).append(i)
+
+    chunks = []
+    for indexes in groups.values():
+        size = -(-len(indexes) // workers)
+        chunks.extend(indexes[start:start + size] for start in range(0, len(indexes), size))
+    return chunks
+
+def tag_chunk(tracks, incremental=False):
+    # Runs in a pool worker. Metrics start empty so the snapshot handed back
+    # covers this chunk only (a forked worker also inherits the parent's).
+    metrics.reset()
+    results = [tag_file(track, incremental) for track in tracks]
+    return results, metrics.snapshot()
+
+def build_frames(track):
+    # Returns the complete set of text/url frames for a track, keyed by HashKey
+    # so a field set twice (e.g. TPOS) keeps the last value.
+    title = track["title"]
+    subtitle = track["subtitle"]
+    rating = track["rating"]
+    comments = track["comments"]
+    contributing_artist = track["contributing_artist"]
+    album_artist = track["album_artist"]
+    album = track["album"]
+    year = track["year"]
+    track_number = track["track_number"]
+    disc_number = track["disc_number"]
+    genre = track["genre"]
+    length = track["length"]
+    bit_rate = track["bit_rate"]
+    publisher = track["publisher"]
+    encoded_by = track["encoded_by"]
+    author_url = track["author_url"]
+    copyright = track["copyright"]
+    parental_rating_reason = track["parental_rating_reason"]
+    composers = track["composers"]
+    conductors = track["conductors"]
+    group_description = track["group_description"]
+    mood = track["mood"]
+    part_of_set = track["part_of_set"]
+    initial_key = track["initial_key"]
+    beats_per_minute_bpm = track["beats_per_minute_bpm"]
+    protected = track["protected"]
+    part_of_compilation = track["part_of_compilation"]
+    isrc = track["isrc"]
+
+    frames = {}
+
+    def add(frame):
+        frames[frame.HashKey] = frame
+
+    def set_txxx(desc, value):
+        add(TXXX(encoding=3, desc=desc, text=value))
+
+    add(TIT2(encoding=3, text=title))  # Title
+    add(TPE1(encoding=3, text=contributing_artist))  # Contributing Artist
+    add(TALB(encoding=3, text=album))  # Album
+    add(TDRC(encoding=3, text=str(year)))  # Year
+    add(TRCK(encoding=3, text=str(track_number)))  # Track Number
+    add(TCON(encoding=3, text=genre))  # Genre
+
+    # Custom TXXX fields
+    # Standard ID3 tag replacements:
+    if comments:
+        add(COMM(encoding=3, lang='eng', desc='', text=comments))
+
+    if publisher:
+        add(TPUB(encoding=3, text=publisher))
+
+    if encoded_by:
+        add(TENC(encoding=3, text=encoded_by))
+
+    if author_url:
+        add(WCOP(encoding=3, url=author_url))  # No exact match, using WCOP for lack of WOAR
+
+    if copyright:
+        add(TCOP(encoding=3, text=copyright))
+
+    if parental_rating_reason:
+        set_txxx('Parental Rating', parental_rating_reason)  # No standard tag; keep as TXXX
+
+    if composers:
+        add(TCOM(encoding=3, text=composers))
+
+    if conductors:
+        add(TPE3(encoding=3, text=conductors))
+
+    if group_description:
+        set_txxx('Group Description', group_description)
+
+    if mood:
+        add(TMOO(encoding=3, text=mood))
+
+    if part_of_set:
+        add(TPOS(encoding=3, text=part_of_set))
+
+    if initial_key:
+        add(TKEY(encoding=3, text=initial_key))
+
+    if beats_per_minute_bpm:
+        add(TBPM(encoding=3, text=str(beats_per_minute_bpm)))
+
+    if protected is not None:
+        set_txxx('Protected', str(protected))
+
+    if part_of_compilation is not None:
+        set_txxx('TCMP', str(part_of_compilation))  # unofficial, iTunes uses this
+
+    if subtitle:
+        add(TSST(encoding=3, text=subtitle))  # Set subtitle as TSST (Set subtitle)
+
+    if rating:
+        # POPM is structured: email, rating (0-255), play count
+        add(POPM(email='user@example.com', rating=int(rating), count=0))
+
+    if album_artist:
+        add(TPE2(encoding=3, text=album_artist))
+
+    if disc_number:
+        add(TPOS(encoding=3, text=str(disc_number)))
+
+    if length:
+        # TLEN expects duration in milliseconds
+        mins, secs = map(int, length.split(':'))
+        millis = (mins * 60 + secs) * 1000
+        add(TLEN(encoding=3, text=str(millis)))
+
+    if bit_rate:
+        set_txxx('Bitrate', str(bit_rate))  # No standard tag for bitrate; custom TXXX
+
+    if isrc:
+        add(TSRC(encoding=3, text=isrc))
+
+    return frames
+
+# Every track of an album points at the same cover, so the bytes, the sniffed
+# MIME type and the APIC frame are kept per art file (and re-read if the file
+# changes on disk). The frame is shared between tracks; mutagen only reads it.
+ART_CACHE_SIZE = 32
+_art_cache = OrderedDict()
+_art_cache_lock = threading.Lock()
+_mime_detector = None
+
+def get_mime_detector():
+    global _mime_detector
+    if _mime_detector is None:
+        import magic
+        _mime_detector = magic.Magic(mime=True)
+    return _mime_detector
+
+def load_album_art(album_art_path):
+    try:
+        # Thumbnails rendered earlier in this process are used as-is, without
+        # reading them back. Art from the thumbnail store is cached by content
+        # hash, so albums sharing a cover share one frame.
+        from crop_thumbnail import get_rendered_thumbnail
+        from thumbnail_store import get_thumbnail_store
+        store = get_thumbnail_store()
+        rendered = get_rendered_thumbnail(album_art_path)
+        digest = rendered[1] if rendered is not None else store.digest_for(album_art_path)
+        if digest is not None:
+            key = digest
+        else:
+            stat = os.stat(album_art_path)
+            key = (album_art_path, stat.st_mtime_ns, stat.st_size)
+        with _art_cache_lock:
+            if key in _art_cache:
+                _art_cache.move_to_end(key)
+                return _art_cache[key]
+
+        if rendered is not None:
+            image_data = rendered[0]
+        elif digest is not None:
+            image_data, _ = store.read(album_art_path)
+        else:
+            with open(album_art_path, 'rb') as img_file:
+                image_data = img_file.read()
+
+        mime_type = get_mime_detector().from_buffer(image_data[:2048])
+
+        apic = None
+        if mime_type in ['image/jpeg', 'image/png']:
+            apic = APIC(
+                encoding=3,       # UTF-8
+                mime=mime_type,   # image mime type
+                type=3,           # front cover
+                desc='Cover',
+                data=image_data
+            )
+        else:
+            print("Unsupported image format. Convert to JPEG or PNG before embedding.")
+
+        with _art_cache_lock:
+            _art_cache[key] = apic
+            while len(_art_cache) > ART_CACHE_SIZE:
+                _art_cache.popitem(last=False)
+        return apic
+
+    except FileNotFoundError:
+        print(f"Album art file not found: {album_art_path}")
+    except Exception as e:
+        print(f"Error loading album art: {e}")
+    return None
+
+def desired_frames(track):
+    frames = build_frames(track)
+    album_art_path = track.get("album art path")
+    if album_art_path:
+        apic = load_album_art(album_art_path)
+        if apic is not None:
+            frames[apic.HashKey] = apic
+    return frames
+
+def frame_fingerprint(frame):
+    # Compares what a frame says rather than how it is encoded (v2.3 saves turn
+    # UTF-8 text into UTF-16); cover art is compared by content hash.
+    if isinstance(frame, APIC):
+        return f"{frame.mime}:{frame.type}:{hashlib.sha1(frame.data).hexdigest()}"
+    return frame.pprint()
+
+def tag_fingerprint(frames):
+    items = sorted((key, frame_fingerprint(frame)) for key, frame in frames.items())
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def changed_frames(tags, frames):
+    return {
+        key: frame for key, frame in frames.items()
+        if key not in tags or frame_fingerprint(tags[key]) != frame_fingerprint(frame)
+    }
+
+def read_tags(file_path):
+    # Parses only the ID3 tag at the head of the file, not the audio frames.
+    try:
+        return ID3(file_path)
+    except ID3NoHeaderError:
+        return None
+
+def tag_file(track, incremental=False):
+    # Builds every frame, art included, in memory and writes the ID3v2.3 tag
+    # with a single save (iTunes atoms for .m4a files). In incremental mode the
+    # existing tag is read first and the file is left alone when it already
+    # matches, otherwise only the frames that differ are replaced. Never
+    # raises: the outcome, the bytes written and the time taken are returned
+    # for the batch report.
+    started = time.perf_counter()
+    file_path = track.get("file_path")
+    result = {"file_path": file_path, "ok": False, "skipped": False, "error": None, "bytes_written": 0, "seconds": 0.0}
+
+    try:
+        if is_mp4(file_path):
+            tag_mp4(track, file_path, incremental, result)
+        else:
+            tag_id3(track, file_path, incremental, result)
+    except Exception as e:
+        result["error"] = str(e)
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def tag_id3(track, file_path, incremental, result):
+    tag_size_before = id3_tag_size(file_path)
+    tags = read_tags(file_path) if incremental else None
+
+    if tags is None:
+        audio = MP3(file_path, ID3=ID3)  # Make sure ID3 is correctly imported at the top
 
         # Ensure ID3 tags exist
         if audio.tags is None:
             audio.add_tags()
-        elif not audio.tags:
-            audio.tags.update_to_v23()
-
-        # Define a function to clean non-ASCII characters if necessary
-        def strip_hex_chars(input_string):
-            if isinstance(input_string, str):
-                return ''.join(char for char in input_string if ord(char) < 128)
-            else:
-                return str(input_string)  # Convert integers to strings
-
-        def set_txxx(tag, desc, value):
-            audio.tags.add(TXXX(encoding=3, desc=desc, text=value))
-
-        # Apply cleaned metadata to the audio file
-        audio.tags.setall('TIT2', [TIT2(encoding=3, text=title)])  # Title
-        audio.tags.setall('TPE1', [TPE1(encoding=3, text=contributing_artist)])  # Contributing Artist
-        audio.tags.setall('TALB', [TALB(encoding=3, text=album)])  # Album
-        audio.tags.setall('TDRC', [TDRC(encoding=3, text=str(year))])  # Year
-        audio.tags.setall('TRCK', [TRCK(encoding=3, text=str(track_number))])  # Track Number
-        audio.tags.setall('TCON', [TCON(encoding=3, text=genre)])  # Genre
-
-        # Custom TXXX fields
-        # Standard ID3 tag replacements:
-        if comments:
-            audio['COMM'] = COMM(encoding=3, lang='eng', desc='', text=comments)
-
-        if publisher:
-            audio['TPUB'] = TPUB(encoding=3, text=publisher)
-
-        if encoded_by:
-            audio['TENC'] = TENC(encoding=3, text=encoded_by)
-
-        if author_url:
-            audio['WOAR'] = WCOP(encoding=3, url=author_url)  # No exact match, using WCOP for lack of WOAR
-
-        if copyright:
-            audio['TCOP'] = TCOP(encoding=3, text=copyright)
-
-        if parental_rating_reason:
-            set_txxx(audio, 'Parental Rating', parental_rating_reason)  # No standard tag; keep as TXXX
-
-        if composers:
-            audio['TCOM'] = TCOM(encoding=3, text=composers)
-
-        if conductors:
-            audio['TPE3'] = TPE3(encoding=3, text=conductors)
-
-        if group_description:
-            set_txxx(audio, 'Group Description', group_description)
-
-        if mood:
-            audio['TMOO'] = TMOO(encoding=3, text=mood)
-
-        if part_of_set:
-            audio['TPOS'] = TPOS(encoding=3, text=part_of_set)
-
-        if initial_key:
-            audio['TKEY'] = TKEY(encoding=3, text=initial_key)
-
-        if beats_per_minute_bpm:
-            audio['TBPM'] = TBPM(encoding=3, text=str(beats_per_minute_bpm))
+        tags = audio.tags
+        frames = desired_frames(track)
+        changes = frames
+    else:
+        frames = desired_frames(track)
+        changes = changed_frames(tags, frames)
+
+    result["fingerprint"] = tag_fingerprint(frames)
+    if not changes:
+        result["ok"] = True
+        result["skipped"] = True
+        return
+
+    for key, frame in changes.items():
+        tags.setall(key, [frame])
+
+    with metrics.span('id3_save'):
+        tags.save(file_path, v2_version=3, padding=tag_padding)  # Save with ID3v2.3 tag version
+
+    # A tag that still fits its old space is rewritten in place; otherwise
+    # mutagen has to move the audio data and rewrite the whole file.
+    tag_size_after = id3_tag_size(file_path)
+    if tag_size_before and tag_size_after == tag_size_before:
+        result["bytes_written"] = tag_size_after
+    else:
+        result["bytes_written"] = os.path.getsize(file_path)
+    result["ok"] = True
+
+ITUNES_FREEFORM = '----:com.apple.iTunes:'
+
+def as_int(value):
+    # "3/12" -> 3, "120.5" -> 120; 0 for anything unparseable.
+    try:
+        return int(float(str(value).split('/')[0]))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+def build_mp4_tags(track):
+    # The same fields as build_frames, as iTunes atoms. Fields without an atom
+    # of their own become freeform atoms, like the TXXX frames on MP3s.
+    tags = {}
+
+    def put(key, value):
+        if value not in (None, '', 0):
+            tags[key] = value if isinstance(value, list) else [value]
+
+    def put_freeform(name, value):
+        if value not in (None, ''):
+            tags[ITUNES_FREEFORM + name] = [MP4FreeForm(str(value).encode('utf-8'))]
+
+    put('\xa9nam', track["title"])
+    put('\xa9ART', track["contributing_artist"])
+    put('\xa9alb', track["album"])
+    put('\xa9day', str(track["year"]) if track["year"] else '')
+    put('\xa9gen', track["genre"])
+    put('\xa9cmt', track["comments"])
+    put('\xa9too', track["encoded_by"])
+    put('cprt', track["copyright"])
+    put('\xa9wrt', track["composers"])
+    put('\xa9grp', track["group_description"])
+    put('aART', track["album_artist"])
+    put('tmpo', as_int(track["beats_per_minute_bpm"]))
+
+    track_number = as_int(track["track_number"])
+    if track_number:
+        tags['trkn'] = [(track_number, 0)]
+    disc_number = as_int(track["disc_number"])
+    if disc_number:
+        tags['disk'] = [(disc_number, 0)]
+    if track["part_of_compilation"] is not None:
+        tags['cpil'] = bool(track["part_of_compilation"])
+
+    put_freeform('SUBTITLE', track["subtitle"])
+    put_freeform('LABEL', track["publisher"])
+    put_freeform('CONDUCTOR', track["conductors"])
+    put_freeform('MOOD', track["mood"])
+    put_freeform('initialkey', track["initial_key"])
+    put_freeform('ISRC', track["isrc"])
+    put_freeform('Parental Rating', track["parental_rating_reason"])
+    put_freeform('Author URL', track["author_url"])
+    if track["rating"]:
+        put_freeform('RATING', track["rating"])
+
+    album_art_path = track.get("album art path")
+    if album_art_path:
+        # Shares the decoded-art cache with the ID3 path.
+        apic = load_album_art(album_art_path)
+        if apic is not None:
+            image_format = MP4Cover.FORMAT_JPEG if apic.mime == 'image/jpeg' else MP4Cover.FORMAT_PNG
+            tags['covr'] = [MP4Cover(apic.data, imageformat=image_format)]
+    return tags
+
+def mp4_fingerprint(tags):
+    def value_fingerprint(value):
+        if isinstance(value, bytes):
+            return hashlib.sha1(value).hexdigest()
+        return repr(value)
+
+    items = sorted((key, [value_fingerprint(v) for v in value] if isinstance(value, list) else repr(value))
+                   for key, value in tags.items())
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def tag_mp4(track, file_path, incremental, result):
+    audio = MP4(file_path)
+    if audio.tags is None:
+        audio.add_tags()
+
+    desired = build_mp4_tags(track)
+    if incremental:
+        changes = {key: value for key, value in desired.items() if audio.tags.get(key) != value}
+    else:
+        changes = desired
+
+    result["fingerprint"] = mp4_fingerprint(desired)
+    if not changes:
+        result["ok"] = True
+        result["skipped"] = True
+        return
+
+    audio.tags.update(changes)
+    with metrics.span('mp4_save'):
+        audio.save()
+    result["bytes_written"] = os.path.getsize(file_path)
+    result["ok"] = True
+
+def embed_track(track, incremental=False):
+    result = tag_file(track, incremental)
+    if result["skipped"]:
+        print(f"Tags already up to date: {result['file_path']}")
+    elif result["ok"]:
+        print("Album art and metadata saved successfully!")
+    else:
+        print(f"Error embedding metadata in {result['file_path']}: {result['error']}")
+    return result
 
-        if protected is not None:
-            set_txxx(audio, 'Protected', str(protected))
 
-        if part_of_compilation is not None:
-            audio['TCMP'] = TXXX(encoding=3, desc='TCMP', text=str(part_of_compilation))  # unofficial, iTunes uses this
-
-        if subtitle:
-            audio['TSST'] = TSST(encoding=3, text=subtitle)  # Set subtitle as TSST (Set subtitle)
-
-        if rating:
-            # POPM is structured: email, rating (0-255), play count
-            audio['POPM'] = POPM(email='user@example.com', rating=int(rating), count=0)
-
-        if album_artist:
-            audio['TPE2'] = TPE2(encoding=3, text=album_artist)
-
-        if disc_number:
-            audio['TPOS'] = TPOS(encoding=3, text=str(disc_number))
-
-        if length:
-            # TLEN expects duration in milliseconds
-            mins, secs = map(int, length.split(':'))
-            millis = (mins * 60 + secs) * 1000
-            audio['TLEN'] = TLEN(encoding=3, text=str(millis))
-
-        if bit_rate:
-            set_txxx(audio, 'Bitrate', str(bit_rate))  # No standard tag for bitrate; custom TXXX
-
-        if isrc:
-            audio['TSRC'] = TSRC(encoding=3, text=isrc)
-
-        # Save changes
-        try:
-            audio.save()
-            print("Metadata embedded successfully!")
-        except Exception as e:
-            print(f"Error saving metadata: {e}")
-
-        # Download and embed album art
-        if album_art_path:
-            try:
-                with open(album_art_path, 'rb') as img_file:
-                    image_data = img_file.read()
-
-                mime_type = magic.Magic(mime=True).from_buffer(image_data[:2048])
-
-                if mime_type in ['image/jpeg', 'image/png']:
-                    audio.tags.add(APIC(
-                        encoding=3,       # UTF-8
-                        mime=mime_type,   # image mime type
-                        type=3,           # front cover
-                        desc='Cover',
-                        data=image_data
-                    ))
-                else:
-                    print("Unsupported image format. Convert to JPEG or PNG before embedding.")
-
-            except FileNotFoundError:
-                print(f"Album art file not found: {album_art_path}")
-            except Exception as e:
-                print(f"Error loading album art: {e}")
-
-        try:
-            audio.save(v2_version=3)  # Save with ID3v2.3 tag version
-            print("Album art and metadata saved successfully!")
-        except Exception as e:
-            print(f"Error saving album art: {e}")
+if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='fetch_metadata_output.txt')
+    parser.add_argument('--workers', type=int, default=0, help="tag files across this many processes (0 = one file at a time)")
+    parser.add_argument('--incremental', action='store_true', help="skip files whose tags already match and only rewrite changed frames")
+    parser.add_argument('--report', help="write a JSON report of per-file results to this path")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
-    with open('fetch_metadata_output.txt', 'r', encoding='utf-8') as f:
+    with open(args.input, 'r', encoding='utf-8') as f:
         input_json = f.read()
 
     metadata_list = json.loads(input_json)  # Now metadata_list is a Python list
     print(f"Read list with {len(metadata_list)} entries.")
 
-    embed_metadata(metadata_list) 
-    # Print JSON stringified results for Node.js to parse
-    #with open("fetch_metadata_output.txt", "w", encoding="utf-8") as f:
-        #json.dump(results, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+    if args.workers:
+        report = embed_metadata_parallel(metadata_list, workers=args.workers, incremental=args.incremental)
+        print(f"Tagged {report['succeeded']} files ({report['skipped']} unchanged), {report['failed']} failed, {report['bytes_written']} bytes written in {report['seconds']:.2f}s")
+    else:
+        results = embed_metadata(metadata_list, incremental=args.incremental)
+        report = {"results": results}
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
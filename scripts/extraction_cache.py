@@ -0,0 +1,153 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+from cache_store import CACHE_DIR, CacheStore
+from store_utils import Lazy
+from http_pool import borrow_ytdlp
+import metrics
+
+EXTRACTION_TTL = 7 * 24 * 60 * 60
+EXTRACTION_MAX_BYTES = 64 * 1024 * 1024
+
+# 'flat' lists playlist entries without resolving each video, 'full' resolves
+# every entry the way a plain extract_info(url, download=False) does.
+MODE_OPTS = {
+    'flat': {'extract_flat': 'in_playlist'},
+    'full': {},
+}
+
+get_store = Lazy(lambda: CacheStore(
+    os.path.join(CACHE_DIR, 'extraction.sqlite'),
+    ttl=EXTRACTION_TTL,
+    max_bytes=EXTRACTION_MAX_BYTES
+))
+
+_store_lock = threading.Lock()
+# key -> [lock, callers holding or waiting on it]; dropped when the last
+# caller is done, so the dict only ever holds extractions in flight.
+_key_locks = {}
+
+@contextmanager
+def _locked(key):
+    with _store_lock:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _store_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[key]
+
+def canonical_id(url):
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if 'list' in query:
+        return f"playlist:{query['list'][0]}"
+    if 'v' in query:
+        return f"video:{query['v'][0]}"
+    if parsed.netloc.endswith('youtu.be') and parsed.path.strip('/'):
+        return f"video:{parsed.path.strip('/')}"
+    return f"url:{url.replace('music.youtube.com', 'www.youtube.com')}"
+
+def extract_info(url, mode='flat', ydl_opts=None):
+    url = url.replace('music.youtube.com', 'www.youtube.com')
+    resource = canonical_id(url)
+    key = f"{mode}:{resource}"
+
+    # Concurrent callers asking for the same playlist wait for the first
+    # extraction instead of starting their own.
+    with _locked(key):
+        store = get_store()
+        info = store.get(key)
+        if info is not None:
+            return info
+
+        opts = {'quiet': True, 'skip_download': True, **MODE_OPTS[mode], **(ydl_opts or {})}
+        with borrow_ytdlp(opts) as ydl, metrics.span('extract', mode=mode):
+            info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+        store.put(key, info, tag=resource)
+        return info
+
+def invalidate(url):
+    return get_store().invalidate(canonical_id(url))
+
+# Streamed listings up to this many entries are cached once enumeration
+# finishes, so a re-run replays them without extracting; longer ones are not
+# held in memory for that.
+STREAM_CACHE_MAX_ENTRIES = 2000
+
+def iter_entries(url, ydl_opts=None):
+    # Flat playlist entries, yielded as yt-dlp pages through the playlist so
+    # the caller can start on the first page while later ones are fetched. A
+    # cached flat extraction is replayed. Yields nothing when the URL is not
+    # a playlist.
+    url = url.replace('music.youtube.com', 'www.youtube.com')
+    resource = canonical_id(url)
+    key = f"flat:{resource}"
+    info = get_store().get(key)
+    if info is not None:
+        yield from info.get('entries') or []
+        return
+
+    opts = {'quiet': True, 'skip_download': True, **MODE_OPTS['flat'], **(ydl_opts or {})}
+    with borrow_ytdlp(opts) as ydl:
+        with metrics.span('extract', mode='stream'):
+            ie_result = ydl.extract_info(url, download=False, process=False)
+            # Playlist pages often resolve to another extractor first.
+            while ie_result.get('_type') in ('url', 'url_transparent'):
+                ie_result = ydl.extract_info(ie_result['url'], download=False, process=False, ie_key=ie_result.get('ie_key'))
+
+        if ie_result.get('_type') not in ('playlist', 'multi_video'):
+            return
+
+        collected = []
+        for entry in _lazy_entries(ie_result.get('entries') or []):
+            if collected is not None:
+                collected.append(entry)
+                if len(collected) > STREAM_CACHE_MAX_ENTRIES:
+                    collected = None
+            yield entry
+
+        if collected is not None:
+            info = ydl.sanitize_info({**ie_result, 'entries': collected})
+            get_store().put(key, info, tag=resource)
+
+def _lazy_entries(entries):
+    if hasattr(entries, 'getpage'):
+        # PagedList: one page at a time rather than getslice(), which would
+        # fetch every page up front.
+        pagenum = 0
+        while True:
+            page = entries.getpage(pagenum)
+            if not page:
+                return
+            yield from page
+            pagenum += 1
+    else:
+        yield from entries
@@ -21,26 +21,82 @@
 import json
 import sys
 from crop_thumbnail import crop_thumbnail
-from chat_gpt import get_all_metadata
+from chat_gpt import get_all_metadata, get_album_metadata, METADATA_FIELDS
 import io
-from yt_dlp import YoutubeDL
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from extraction_cache import extract_info
 
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-
-def chat_gpt_api(meta):
-
-    # Create the metadata dictionary
-    test_metadata = {
+def track_input(meta):
+    return {
         "title": meta.get('title', '') ,
         "contributing_artist": meta.get('artist',''),
         "album": meta.get('album'),
         "track_number": meta.get('track_number')
     }
 
-    # Fetch filled metadata from the OpenAI model
-    metadata = get_all_metadata(test_metadata)
+def format_length(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def resolve_local(meta):
+    # Fields known without asking the model, in the model's own shape. The
+    # yt-dlp info comes first; the file on disk then overrides length and
+    # bit rate with exact values.
+    local = {}
+    if meta.get('music_metadata'):
+        for field, key in (("title", 'title'), ("contributing_artist", 'artist'), ("album", 'album')):
+            if meta.get(key) and meta[key] != 'N/A':
+                local[field] = meta[key]
+    if meta.get('release_year'):
+        local["year"] = int(meta['release_year'])
+    if meta.get('duration'):
+        local["length"] = format_length(meta['duration'])
+
+    try:
+        import mutagen
+        audio = mutagen.File(meta['file_path']) if meta.get('file_path') else None
+    except Exception as e:
+        print(f"[WARN] Could not read {meta.get('file_path')}: {e}")
+        audio = None
+    if audio is not None and audio.info is not None:
+        if getattr(audio.info, 'length', 0):
+            local["length"] = format_length(audio.info.length)
+        if getattr(audio.info, 'bitrate', 0):
+            local["bit_rate"] = audio.info.bitrate // 1000
+    return local
+
+def missing_fields(local):
+    return [f for f in METADATA_FIELDS if f not in local]
+
+def chat_gpt_api(meta):
+    # Local fields first; the model (or its cache) is only asked for the rest.
+    local = resolve_local(meta)
+    metadata = get_all_metadata(track_input(meta), fields=missing_fields(local))
+    return process_metadata({**metadata, **local})
+
+def chat_gpt_album_api(metas):
+    # One function call for the whole album. Tracks the model left out of the
+    # response fall back to a per-track request.
+    album = {"album": metas[0].get('album')}
+    tracks = []
+    for meta in metas:
+        track = track_input(meta)
+        del track["album"]
+        tracks.append(track)
+
+    # One schema for the album: every field any of its tracks still lacks.
+    local = [resolve_local(meta) for meta in metas]
+    missing = {f for known in local for f in missing_fields(known)}
+    fields = [f for f in METADATA_FIELDS if f in missing]
 
-    # Process the metadata
+    results = get_album_metadata(album, tracks, fields=fields)
+    return [
+        process_metadata({**metadata, **known}) if metadata is not None else chat_gpt_api(meta)
+        for meta, known, metadata in zip(metas, local, results)
+    ]
+
+def process_metadata(metadata):
     processed_metadata = {
         "title": metadata.get("title", ""),
         "subtitle": metadata.get("subtitle", ""),
@@ -75,9 +131,11 @@ def chat_gpt_api(meta):
 
     return processed_metadata    
 
-gpt_meta = []
+DEFAULT_CONCURRENCY = 4
+# "png" or "jpeg" (baseline, much smaller APIC frames)
+DEFAULT_THUMBNAIL_FORMAT = "png"
 
-def fetch_metadata(yt_metadata):
+def fetch_metadata(yt_metadata, batch=True, concurrency=DEFAULT_CONCURRENCY, thumbnail_format=DEFAULT_THUMBNAIL_FORMAT):
     # Your JSON metadata string (usually you get this from a file or an API)
     songs = yt_metadata
 
@@ -85,34 +143,23 @@ def fetch_metadata(yt_metadata):
     print("Raw input received from stdin:")
     print(repr(songs))  # This will show you exactly what's being passed
     tracks = songs
-    downloaded_albums = set()
-    downloaded_thumbnails = set()
+    gpt_meta = []
+    album_tracks = {}
 
     print(f"Type of tracks: {type(tracks)}")
     if isinstance(tracks, list) and len(tracks) > 0:
         print(f"Type of first track: {type(tracks[0])}")
-    # Example: iterate and print unpacked info
-    for track in tracks:
 
-        current_song_meta = set()
-        
+    enriched = enrich_tracks([song_meta(track) for track in tracks], batch, concurrency)
+
+    # Example: iterate and print unpacked info
+    for index, (track, metadata) in enumerate(zip(tracks, enriched)):
         track_number = track['Track Number']
         title = track['Track Title']
         artist = track['Artist']
         album = track['Album']
         file_path = track['File Path']
         thumbnail_url = track['Thumbnail URL']
-        service = track['Service']
-        albumUrl = track['Album URL']
-
-        current_song_meta = {
-            'track_number': track_number,
-            'title': title,
-            'artist': artist,
-            'album': album,
-            'file_path': file_path,
-            'thumbnail_url': thumbnail_url
-        } 
 
         print(f"Track Number: {track_number}")
         print(f"Title: {title}")
@@ -122,74 +169,132 @@ def fetch_metadata(yt_metadata):
         print(f"Thumbnail URL: {thumbnail_url}")
         print("-" * 40)
 
-        save_path = f"assets/bin/thumbnails/"
-
-        metadata = chat_gpt_api(current_song_meta)
-        gpt_meta.append({
-            **metadata,
-            'album art path': save_path + metadata['album'] + '.png',
-            'file_path': file_path
-        })
-
-        if (album) not in downloaded_albums:
-            if (service != "youtube_music"):
-                thumbnail_url = get_album_thumbnail(albumUrl)
-                album = metadata["album"]
-                if (album.lower() != get_album_from_albumUrl(albumUrl).lower()):
-                    album = get_album_from_albumUrl(albumUrl)
-                    gpt_meta[-1]['album'] = album
-                    gpt_meta[-1]['album art path'] = save_path + album + '.png'
-            crop_thumbnail(thumbnail_url, save_path, album)
-            downloaded_albums.add(album)
-            downloaded_thumbnails.add(thumbnail_url)
-
-
-        
+        gpt_meta.append(build_record(track, metadata))
+        album_tracks.setdefault(album, []).append(index)
+
         print(metadata)
-    
+
+    # Album art only depends on the first track of each album, so the albums
+    # are prepared side by side once every track has its metadata and the
+    # resulting path is shared with the rest of the album.
+    def prepare_art(indexes):
+        first = indexes[0]
+        try:
+            prepare_album_art(tracks[first], gpt_meta[first], thumbnail_format)
+        except Exception as e:
+            print(f"[ERROR] Failed to prepare album art for {tracks[first]['Album']}: {e}")
+        for index in indexes[1:]:
+            gpt_meta[index]['album art path'] = gpt_meta[first]['album art path']
+
+    run_concurrently(prepare_art, list(album_tracks.values()), concurrency)
+
     return(gpt_meta)
 
-def get_album_from_albumUrl(url):
-    ydl_opts = {
-        'quiet': True,
-        'skip_download': True,
-        'extract_flat': True,
+def build_record(track, metadata):
+    # 'album art path' is filled in by prepare_album_art once the art exists.
+    return {
+        **metadata,
+        'album art path': None,
+        'file_path': track['File Path']
     }
 
-    with YoutubeDL(ydl_opts) as ydl:
-        try:
-            info_dict = ydl.extract_info(url, download=False)
-            album_title = info_dict.get('title')
-            return album_title if album_title else ''
-        except Exception as e:
-            print(f"[ERROR] Could not extract album title from URL: {url}\n{e}")
-            return ''
+def enrich_track(track):
+    # Single-track enrichment for the streaming pipeline. Album art is left to
+    # the caller so it can be prepared once per album.
+    return build_record(track, chat_gpt_api(song_meta(track)))
 
+def prepare_album_art(track, record, thumbnail_format=DEFAULT_THUMBNAIL_FORMAT):
+    thumbnail_url = track['Thumbnail URL']
+    albumUrl = track['Album URL']
 
-def get_album_thumbnail(url):
-    ydl_opts = {
-        'quiet': True,
-        'skip_download': True,
-        'extract_flat': True,  # Speeds up if it's a playlist
+    if (track['Service'] != "youtube_music"):
+        thumbnail_url = get_album_thumbnail(albumUrl)
+        album = record["album"]
+        album_from_url = get_album_from_albumUrl(albumUrl)
+        if (album.lower() != album_from_url.lower()):
+            album = album_from_url
+            record['album'] = album
+    # Stored by content, so albums the model renames or that share a name
+    # never overwrite each other's art. The rendered bytes also stay in
+    # memory for embed_metadata in this process.
+    record['album art path'], _ = crop_thumbnail(thumbnail_url, fmt=thumbnail_format)
+
+def run_concurrently(fn, items, concurrency=DEFAULT_CONCURRENCY):
+    # pool.map keeps results in the order of `items`.
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as pool:
+        return list(pool.map(fn, items))
+
+def song_meta(track):
+    return {
+        'track_number': track['Track Number'],
+        'title': track['Track Title'],
+        'artist': track['Artist'],
+        'album': track['Album'],
+        'file_path': track['File Path'],
+        'thumbnail_url': track['Thumbnail URL'],
+        'album_url': track.get('Album URL'),
+        'music_metadata': track.get('Music Metadata', False),
+        'release_year': track.get('Release Year'),
+        'duration': track.get('Duration')
     }
 
-    with YoutubeDL(ydl_opts) as ydl:
-        try:
-            info_dict = ydl.extract_info(url, download=False)
-            # For single videos or playlists, 'thumbnail' key may be in different places
-            if 'thumbnails' in info_dict:
-                return info_dict['thumbnails'][1]['url']
-            elif 'entries' in info_dict and info_dict['entries']:
-                # Check first item in playlist
-                return info_dict['entries'][0].get('thumbnail')
-            else:
-                print("[WARN] No thumbnail found in info_dict.")
-                return None
-        except Exception as e:
-            print(f"[ERROR] Failed to extract thumbnail from URL {url}: {e}")
+def enrich_tracks(metas, batch=True, concurrency=DEFAULT_CONCURRENCY):
+    # Returns processed metadata for every track, in input order. In batch mode
+    # tracks sharing an album are sent to the model in a single request; the
+    # remaining requests run concurrently.
+    groups = {}
+    for i, meta in enumerate(metas):
+        key = (meta['album'], meta['album_url']) if batch else i
+        groups.setdefault(key, []).append(i)
+
+    def enrich_group(indexes):
+        group = [metas[i] for i in indexes]
+        return chat_gpt_album_api(group) if len(group) > 1 else [chat_gpt_api(group[0])]
+
+    groups = list(groups.values())
+    enriched = [None] * len(metas)
+    for indexes, results in zip(groups, run_concurrently(enrich_group, groups, concurrency)):
+        for i, metadata in zip(indexes, results):
+            enriched[i] = metadata
+    return enriched
+
+def get_album_from_albumUrl(url):
+    try:
+        info_dict = extract_info(url)
+        album_title = info_dict.get('title')
+        return album_title if album_title else ''
+    except Exception as e:
+        print(f"[ERROR] Could not extract album title from URL: {url}\n{e}")
+        return ''
+
+
+def get_album_thumbnail(url):
+    try:
+        info_dict = extract_info(url)
+        # For single videos or playlists, 'thumbnail' key may be in different places
+        if 'thumbnails' in info_dict:
+            return info_dict['thumbnails'][1]['url']
+        elif 'entries' in info_dict and info_dict['entries']:
+            # Check first item in playlist
+            return info_dict['entries'][0].get('thumbnail')
+        else:
+            print("[WARN] No thumbnail found in info_dict.")
             return None
+    except Exception as e:
+        print(f"[ERROR] Failed to extract thumbnail from URL {url}: {e}")
+        return None
 
 if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--no-batch', dest='batch', action='store_false', help="send one LLM request per track instead of one per album")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--thumbnail-format', choices=['png', 'jpeg'], default=DEFAULT_THUMBNAIL_FORMAT)
+    args = parser.parse_args()
+
     with open('download_song_output.txt', 'r', encoding='utf-8') as f:
         input_json = f.read()
 
@@ -197,7 +302,7 @@ if __name__ == "__main__":
     print(f"Read list with {len(metadata_list)} entries.")
 
     # Call your main processing function with the list
-    results = fetch_metadata(metadata_list)
+    results = fetch_metadata(metadata_list, batch=args.batch, concurrency=args.concurrency, thumbnail_format=args.thumbnail_format)
 
     # Print JSON stringified results for Node.js to parse
     with open("fetch_metadata_output.txt", "w", encoding="utf-8") as f:
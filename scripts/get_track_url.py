@@ -18,42 +18,139 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import sys
+import re
 import json
-from yt_dlp import YoutubeDL
+import argparse
+from difflib import SequenceMatcher
+from extraction_cache import extract_info
+from track_title import clean_track_title
+
+# Matches scoring below this are reported with their score but no URL.
+MIN_SCORE = 0.6
+
+def normalize_text(text):
+    # Casefolded with punctuation dropped and whitespace collapsed.
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.casefold()).split())
+
+def normalize_title(title):
+    # Same noise stripping as track_title.clean_track_title ("(Official
+    # Audio)", "Artist - " prefixes, bracketed extras), then normalize_text,
+    # so "I Gotta Feeling (Official Video)" and "i gotta feeling" compare
+    # equal.
+    cleaned = clean_track_title(title)
+    if cleaned == 'N/A':
+        return ''
+    return normalize_text(cleaned)
+
+def title_variants(title):
+    # The cleaned title and the raw one: clean_track_title drops everything
+    # before " - ", which is the artist in "Artist - Song" but the song in
+    # "Song - Remastered 2009".
+    variants = []
+    for variant in (normalize_title(title), normalize_text(title or '')):
+        if variant and variant not in variants:
+            variants.append(variant)
+    return variants
+
+def entry_url(entry):
+    return f"https://www.youtube.com/watch?v={entry.get('id')}"
+
+def score_title(query, query_tokens, title, title_tokens):
+    return max(
+        SequenceMatcher(None, query, title).ratio(),
+        len(query_tokens & title_tokens) / len(query_tokens | title_tokens),
+        # The old substring rule, kept just below an exact match. Only the
+        # query inside the title: a short title such as "Intro" inside a
+        # longer query says nothing.
+        0.9 if query in title else 0.0
+    )
+
+class TitleIndex:
+    # Built once per playlist: exact lookups on every normalized variant of
+    # each title, and a token index so fuzzy scoring only looks at titles
+    # sharing a word with the query.
+
+    def __init__(self, entries):
+        self.entries = []
+        self.titles = []
+        self.exact = {}
+        self.tokens = {}
+        for entry in entries:
+            variants = title_variants(entry.get('title') or '')
+            if not variants:
+                continue
+            position = len(self.entries)
+            self.entries.append(entry)
+            for title in variants:
+                slot = len(self.titles)
+                self.titles.append((title, set(title.split()), position))
+                self.exact.setdefault(title, position)
+                for token in set(title.split()):
+                    self.tokens.setdefault(token, []).append(slot)
+
+    def match(self, track_name):
+        # Returns (entry, score) for the best match, or (None, 0.0).
+        queries = title_variants(track_name)
+        if not queries:
+            return None, 0.0
+        for query in queries:
+            if query in self.exact:
+                return self.entries[self.exact[query]], 1.0
+
+        best, best_score = None, 0.0
+        for query in queries:
+            query_tokens = set(query.split())
+            candidates = sorted({slot for token in query_tokens for slot in self.tokens.get(token, [])})
+            if not candidates:
+                # Misspelt in every word: fall back to scoring the whole playlist.
+                candidates = range(len(self.titles))
+            for slot in candidates:
+                title, title_tokens, position = self.titles[slot]
+                score = score_title(query, query_tokens, title, title_tokens)
+                if score > best_score:
+                    best, best_score = self.entries[position], score
+        return best, round(best_score, 3)
+
+def playlist_entries(info):
+    # Flat playlist entries, or the video itself when the URL is not a playlist.
+    return info.get('entries') or [info]
+
+def resolve_tracks(playlist_url, track_names):
+    # One extraction and one index for the whole list. Returns, in input
+    # order, {"track", "url", "title", "score"}; url is None when nothing
+    # scores MIN_SCORE or better.
+    index = TitleIndex(playlist_entries(extract_info(playlist_url)))
+    results = []
+    for track_name in track_names:
+        entry, score = index.match(track_name)
+        matched = entry is not None and score >= MIN_SCORE
+        results.append({
+            "track": track_name,
+            "url": entry_url(entry) if matched else None,
+            "title": entry.get('title') if entry is not None else None,
+            "score": score
+        })
+    return results
 
 def get_track_url(playlist_url, track_name):
-    options = {
-        'extract_flat': True,
-        'dump_single_json': True,
-        'quiet': True,
-    }
+    try:
+        return resolve_tracks(playlist_url, [track_name])[0]["url"]
+    except Exception as e:
+        print(json.dumps({'url': None, 'error': str(e)}))
+        return None
 
-    with YoutubeDL(options) as ydl:
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('playlist_url', nargs='?', default='https://www.youtube.com/playlist?list=OLAK5uy_mp-BuWDQHAM9Up7syTjX3T_SQgC6PjgVA')
+    parser.add_argument('track_names', nargs='*', default=['I Gotta Feeling'])
+    parser.add_argument('--batch', action='store_true', help="resolve every track name in one call and print {\"results\": [...]} with match scores")
+    args = parser.parse_args()
+
+    if args.batch:
         try:
-            info = ydl.extract_info(playlist_url, download=False)
+            print(json.dumps({'results': resolve_tracks(args.playlist_url, args.track_names)}))
         except Exception as e:
-            print(json.dumps({'url': None, 'error': str(e)}))
-            return None
-
-        # Handle flat playlist entries
-        entries = info.get('entries')
-        if entries:
-            for entry in entries:
-                title = entry.get('title', '').lower()
-                if track_name.lower() in title:
-                    return f"https://www.youtube.com/watch?v={entry.get('id')}"
-        else:
-            # Not a playlist, maybe a single video
-            title = info.get('title', '').lower()
-            if track_name.lower() in title:
-                return f"https://www.youtube.com/watch?v={info.get('id')}"
-
-    return None
-
-if __name__ == "__main__":
-    playlist_url = sys.argv[1] if len(sys.argv) > 1 else 'https://www.youtube.com/playlist?list=OLAK5uy_mp-BuWDQHAM9Up7syTjX3T_SQgC6PjgVA'
-    track_name = sys.argv[2] if len(sys.argv) > 2 else 'I Gotta Feeling'
-    
-    result = get_track_url(playlist_url, track_name)
-    print(json.dumps({'url': result}))
+            print(json.dumps({'results': None, 'error': str(e)}))
+    else:
+        result = get_track_url(args.playlist_url, args.track_names[0])
+        print(json.dumps({'url': result}))
@@ -0,0 +1,120 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import atexit
+import json
+import threading
+from contextlib import contextmanager
+
+# Shared keep-alive connections for everything the scripts fetch. Thumbnails
+# and API calls go to a handful of hosts, so reusing connections saves a TLS
+# handshake on nearly every request.
+HTTP_POOL_SIZE = 16
+HTTP_TIMEOUT = (5, 30)              # connect, read
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+
+OPENAI_TIMEOUT = 120.0
+OPENAI_CONNECT_TIMEOUT = 5.0
+OPENAI_KEEPALIVE_EXPIRY = 60.0
+
+_lock = threading.Lock()
+_session = None
+_http_client = None
+
+def get_session():
+    # requests.Session for plain GETs (album art). Idempotent requests are
+    # retried on connection errors and 5xx responses with backoff. Callers
+    # still pass timeout=HTTP_TIMEOUT, requests has no session-wide default.
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({'GET', 'HEAD'}),
+                respect_retry_after_header=True
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def get_http_client():
+    # httpx client handed to the OpenAI SDK so concurrent enrichment threads
+    # share one sized connection pool.
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+            )
+        return _http_client
+
+# Idle YoutubeDL instances keyed by their options. A caller borrows one for a
+# whole extraction or download, so instances (and the connections they hold)
+# live for the whole process but are never shared between threads at once.
+_ytdlp_idle = {}
+
+def ytdlp_key(opts):
+    return json.dumps(opts, sort_keys=True, default=str)
+
+@contextmanager
+def borrow_ytdlp(opts):
+    key = ytdlp_key(opts)
+    with _lock:
+        idle = _ytdlp_idle.setdefault(key, [])
+        ydl = idle.pop() if idle else None
+    if ydl is None:
+        import yt_dlp
+        ydl = yt_dlp.YoutubeDL(opts)
+    try:
+        yield ydl
+    finally:
+        with _lock:
+            _ytdlp_idle.setdefault(key, []).append(ydl)
+
+def close_pools():
+    global _session, _http_client
+    with _lock:
+        idle = [ydl for instances in _ytdlp_idle.values() for ydl in instances]
+        _ytdlp_idle.clear()
+        session, http_client = _session, _http_client
+        _session = _http_client = None
+    for ydl in idle:
+        ydl.close()
+    if session is not None:
+        session.close()
+    if http_client is not None:
+        http_client.close()
+
+atexit.register(close_pools)
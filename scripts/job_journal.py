@@ -0,0 +1,183 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from cache_store import CACHE_DIR
+from store_utils import Lazy, connect, eprint, file_unchanged
+
+JOURNAL_PATH = os.path.join(CACHE_DIR, 'jobs.sqlite')
+
+# A track moves through these in order; each one is recorded as it completes.
+STAGES = ['downloaded', 'enriched', 'art_ready', 'tagged']
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class JobJournal:
+    # Durable record of where every track of a job got to. Each completed
+    # stage is stored with its output (download metadata, enriched record) and
+    # the hash of the audio file at that point, so a re-run of the same link
+    # can pick up each track at its first incomplete stage, as long as the
+    # file on disk is still the one the journal saw.
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job TEXT PRIMARY KEY,"
+                " url TEXT NOT NULL,"
+                " service TEXT,"
+                " media TEXT,"
+                " created REAL NOT NULL,"
+                " finished REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stages ("
+                " job TEXT NOT NULL,"
+                " track_number INTEGER NOT NULL,"
+                " stage TEXT NOT NULL,"
+                " data TEXT,"
+                " file_path TEXT,"
+                " file_hash TEXT,"
+                " file_size INTEGER,"
+                " file_mtime_ns INTEGER,"
+                " source TEXT,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (job, track_number, stage))"
+            )
+            # Journals written before size/mtime and the source were kept get
+            # the columns added; their rows are re-hashed once on the next
+            # check, and their downloads are redone once (no source to match).
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(stages)")}
+            for column, kind in (('file_size', 'INTEGER'), ('file_mtime_ns', 'INTEGER'), ('source', 'TEXT')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE stages ADD COLUMN {column} {kind}")
+
+    def _connect(self):
+        return connect(self.path)
+
+    @staticmethod
+    def job_id(url, service, media, profile=None):
+        from extraction_cache import canonical_id
+        return hashlib.sha1(f"{canonical_id(url)}|{service}|{media}|{profile}".encode('utf-8')).hexdigest()
+
+    def start(self, url, service, media, fresh=False, profile=None):
+        # Returns the Job for this link, resuming the earlier one unless fresh.
+        # Each output profile is its own job, since the files differ.
+        job = self.job_id(url, service, media, profile)
+        with self._connect() as conn:
+            if fresh:
+                conn.execute("DELETE FROM stages WHERE job = ?", (job,))
+                conn.execute("DELETE FROM jobs WHERE job = ?", (job,))
+            conn.execute(
+                "INSERT OR IGNORE INTO jobs (job, url, service, media, created) VALUES (?, ?, ?, ?, ?)",
+                (job, url, service, media, time.time())
+            )
+            conn.execute("UPDATE jobs SET finished = NULL WHERE job = ?", (job,))
+        return Job(self, job)
+
+class Job:
+    def __init__(self, journal, job):
+        self.journal = journal
+        self.id = job
+
+    def record(self, track_number, stage, data=None, file_path=None, source=None):
+        # Pass file_path for stages that write the audio file, so its new hash
+        # is what later runs compare against, and source (the video the stage
+        # worked on) where the track number alone does not pin it down.
+        file_digest = file_size = file_mtime_ns = None
+        if file_path:
+            try:
+                stat = os.stat(file_path)
+                file_digest = file_hash(file_path)
+                file_size, file_mtime_ns = stat.st_size, stat.st_mtime_ns
+            except OSError as e:
+                eprint(f"[WARN] Could not hash {file_path} for the job journal: {e}")
+        try:
+            with self.journal._connect() as conn:
+                if file_path:
+                    # A new file invalidates whatever later stages did to the old one.
+                    later = STAGES[STAGES.index(stage) + 1:]
+                    conn.executemany(
+                        "DELETE FROM stages WHERE job = ? AND track_number = ? AND stage = ?",
+                        [(self.id, track_number, later_stage) for later_stage in later]
+                    )
+                conn.execute(
+                    "INSERT OR REPLACE INTO stages (job, track_number, stage, data, file_path, file_hash, file_size, file_mtime_ns, source, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (self.id, track_number, stage, json.dumps(data, ensure_ascii=False, default=str), file_path, file_digest, file_size, file_mtime_ns, source, time.time())
+                )
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Job journal write failed for track {track_number} ({stage}): {e}")
+
+    def completed(self, track_number, stage, source=None):
+        # The data stored for `stage`, or None if the track has not reached it,
+        # its file changed since the latest stage was recorded, or (when
+        # source is given) the stage was recorded for a different video, as
+        # happens when a playlist is reordered between runs.
+        try:
+            with self.journal._connect() as conn:
+                rows = conn.execute(
+                    "SELECT stage, data, file_path, file_hash, file_size, file_mtime_ns, source FROM stages WHERE job = ? AND track_number = ?",
+                    (self.id, track_number)
+                ).fetchall()
+                by_stage = {row[0]: row for row in rows}
+                if stage not in by_stage:
+                    return None
+                if source is not None and by_stage[stage][6] != source:
+                    return None
+
+                # Only stages that change the file record its hash; check the latest.
+                hashed = [row for row in by_stage.values() if row[3]]
+                if hashed and not self._file_unchanged(conn, track_number, max(hashed, key=lambda row: STAGES.index(row[0]))):
+                    return None
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Job journal read failed for track {track_number}: {e}")
+            return None
+        return json.loads(by_stage[stage][1])
+
+    def _file_unchanged(self, conn, track_number, row):
+        # The file the latest hashed stage recorded; its new size and mtime
+        # are stored when only those changed.
+        recorded_stage, _, file_path, expected, size, mtime_ns = row[:6]
+
+        def rehashed(new_size, new_mtime_ns):
+            conn.execute(
+                "UPDATE stages SET file_size = ?, file_mtime_ns = ? WHERE job = ? AND track_number = ? AND stage = ?",
+                (new_size, new_mtime_ns, self.id, track_number, recorded_stage)
+            )
+
+        return file_unchanged(file_path, size, mtime_ns, expected, file_hash, rehashed)
+
+    def finish(self):
+        with self.journal._connect() as conn:
+            conn.execute("UPDATE jobs SET finished = ? WHERE job = ?", (time.time(), self.id))
+
+get_journal = Lazy(JobJournal)
@@ -0,0 +1,144 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from cache_store import CACHE_DIR
+from store_utils import Lazy, connect, eprint, file_unchanged
+from audio_format import id3_tag_size, is_mp4, mp4_audio_range
+
+LIBRARY_PATH = os.path.join(CACHE_DIR, 'library.sqlite')
+
+def video_id(url):
+    from extraction_cache import canonical_id
+    resource = canonical_id(url)
+    return resource[len('video:'):] if resource.startswith('video:') else None
+
+def audio_hash(path):
+    # Hash of the audio only: the ID3 tag in front (or, for .m4a files,
+    # everything outside the mdat atom) is skipped, so re-tagging a file does
+    # not make it look like a different recording.
+    start, length = id3_tag_size(path), None
+    if is_mp4(path):
+        start, length = mp4_audio_range(path)
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length is None or length > 0:
+            chunk = f.read(1024 * 1024 if length is None else min(length, 1024 * 1024))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if length is not None:
+                length -= len(chunk)
+    return digest.hexdigest()
+
+class LibraryIndex:
+    # Every track downloaded so far, by YouTube video ID and, where yt-dlp
+    # reports one, ISRC. Each entry keeps the file's path, size, mtime and
+    # audio hash plus the download metadata, so a track that is already on
+    # disk can be handed back without extracting or downloading it again.
+
+    def __init__(self, path=LIBRARY_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                " video_id TEXT PRIMARY KEY,"
+                " isrc TEXT,"
+                " file_path TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " audio_hash TEXT NOT NULL,"
+                " metadata TEXT NOT NULL,"
+                " added REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tracks_isrc ON tracks (isrc)")
+
+    def _connect(self):
+        return connect(self.path)
+
+    def _verify(self, conn, row):
+        # The stored metadata if the file is still the one that was indexed.
+        # An unchanged size and mtime is trusted; otherwise the audio is
+        # re-hashed, which still matches after the file was only re-tagged.
+        video, file_path, size, mtime_ns, expected, metadata = row
+
+        def rehashed(new_size, new_mtime_ns):
+            conn.execute(
+                "UPDATE tracks SET size = ?, mtime_ns = ? WHERE video_id = ?",
+                (new_size, new_mtime_ns, video)
+            )
+
+        if not file_unchanged(file_path, size, mtime_ns, expected, audio_hash, rehashed):
+            conn.execute("DELETE FROM tracks WHERE video_id = ?", (video,))
+            return None
+        return json.loads(metadata)
+
+    def _lookup(self, where, value):
+        if not value:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT video_id, file_path, size, mtime_ns, audio_hash, metadata FROM tracks WHERE " + where,
+                    (value,)
+                ).fetchone()
+                return self._verify(conn, row) if row is not None else None
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Library index read failed for {value}: {e}")
+            return None
+
+    def lookup(self, video):
+        return self._lookup("video_id = ?", video)
+
+    def lookup_isrc(self, isrc):
+        return self._lookup("isrc = ?", isrc)
+
+    def add(self, video, file_path, metadata, isrc=None):
+        if not video:
+            return
+        try:
+            stat = os.stat(file_path)
+            digest = audio_hash(file_path)
+        except OSError as e:
+            eprint(f"[WARN] Could not index {file_path}: {e}")
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tracks (video_id, isrc, file_path, size, mtime_ns, audio_hash, metadata, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (video, isrc, file_path, stat.st_size, stat.st_mtime_ns, digest,
+                     json.dumps(metadata, ensure_ascii=False, default=str), time.time())
+                )
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Library index write failed for {file_path}: {e}")
+
+    def remove(self, video):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM tracks WHERE video_id = ?", (video,))
+
+get_library = Lazy(LibraryIndex)
@@ -0,0 +1,159 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Spans (timed sections) and counters for the scripts. Everything is aggregated
+# in process and can be read with snapshot(). Two optional outputs:
+#   IPOD_METRICS_LOG=<file>|stderr  one JSON line per span and counter update,
+#                                   appended, so worker processes share a file
+#   IPOD_METRICS_PROM=<file>        Prometheus text format, written at exit by
+#                                   the main process
+METRICS_LOG = os.environ.get('IPOD_METRICS_LOG')
+METRICS_PROM = os.environ.get('IPOD_METRICS_PROM')
+PREFIX = 'ipod_'
+
+_lock = threading.Lock()
+_spans = {}        # (name, labels) -> [count, total seconds, max seconds]
+_counters = {}     # (name, labels) -> value
+_log_file = None
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def emit(event):
+    global _log_file
+    if not METRICS_LOG:
+        return
+    line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        if _log_file is None:
+            _log_file = sys.stderr if METRICS_LOG == 'stderr' else open(METRICS_LOG, 'a', encoding='utf-8')
+        _log_file.write(line)
+        _log_file.flush()
+
+def record_span(name, seconds, ok=True, **labels):
+    with _lock:
+        stats = _spans.setdefault(_key(name, labels), [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+    emit({'type': 'span', 'name': name, 'seconds': round(seconds, 6), 'ok': ok,
+          'ts': time.time(), 'pid': os.getpid(), **labels})
+
+@contextmanager
+def span(name, **labels):
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        record_span(name, time.perf_counter() - started, ok, **labels)
+
+def count(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+    emit({'type': 'counter', 'name': name, 'value': value, 'ts': time.time(), 'pid': os.getpid(), **labels})
+
+def snapshot():
+    with _lock:
+        spans = [
+            {'name': name, 'labels': dict(labels), 'count': n, 'seconds': round(total, 6), 'max_seconds': round(peak, 6)}
+            for (name, labels), (n, total, peak) in sorted(_spans.items())
+        ]
+        counters = [
+            {'name': name, 'labels': dict(labels), 'value': value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+    return {'spans': spans, 'counters': counters}
+
+def merge(data):
+    # Folds a snapshot() taken in another process (a pool worker) into this
+    # one, so its spans and counters reach this process's outputs. The worker
+    # already logged its own events, so nothing is emitted again.
+    with _lock:
+        for entry in data['spans']:
+            stats = _spans.setdefault(_key(entry['name'], entry['labels']), [0, 0.0, 0.0])
+            stats[0] += entry['count']
+            stats[1] += entry['seconds']
+            stats[2] = max(stats[2], entry['max_seconds'])
+        for entry in data['counters']:
+            key = _key(entry['name'], entry['labels'])
+            _counters[key] = _counters.get(key, 0) + entry['value']
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{k}="' + v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+def prometheus_text():
+    data = snapshot()
+    lines = []
+    typed = set()
+    for entry in data['spans']:
+        metric = f"{PREFIX}{entry['name']}_seconds"
+        labels = _labels_text(sorted(entry['labels'].items()))
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} summary")
+            typed.add(metric)
+        lines.append(f"{metric}_count{labels} {entry['count']}")
+        lines.append(f"{metric}_sum{labels} {entry['seconds']}")
+    for entry in data['counters']:
+        metric = f"{PREFIX}{entry['name']}_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels_text(sorted(entry['labels'].items()))} {entry['value']}")
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path=None):
+    path = path or METRICS_PROM
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+def _write_at_exit():
+    # Pool workers import this module too; only the main process owns the file.
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        write_prometheus()
+
+if METRICS_PROM:
+    atexit.register(_write_at_exit)
@@ -0,0 +1,168 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Streaming download -> enrich -> embed pipeline. Each stage runs on its own
+# threads and hands a track to the next stage as soon as it is ready, so the
+# first tracks of an album are tagged while later ones are still downloading.
+# Nothing is written to download_song_output.txt / fetch_metadata_output.txt,
+# which also lets several jobs run side by side.
+
+import argparse
+import io
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from download_song import stream_song, DEFAULT_CONCURRENCY, DEFAULT_PROFILE, PROFILES
+from fetch_metadata import enrich_track, prepare_album_art, DEFAULT_THUMBNAIL_FORMAT
+from embed_metadata import embed_metadata
+from job_journal import get_journal
+
+_DONE = object()
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+def threaded_stage(fn, items, workers=1):
+    # Applies fn to every item of the upstream iterable on `workers` threads and
+    # yields (item, result, error) tuples in completion order. The upstream is
+    # consumed on a feeder thread, so results flow downstream without waiting
+    # for the next input. An upstream failure is reported with item=None.
+    results = queue.Queue()
+    slots = threading.Semaphore(workers * 2)
+
+    def run(item):
+        try:
+            results.put((item, fn(item), None))
+        except Exception as e:
+            results.put((item, None, e))
+        finally:
+            slots.release()
+
+    def feed():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for item in items:
+                    slots.acquire()
+                    pool.submit(run, item)
+        except Exception as e:
+            results.put((None, None, e))
+        finally:
+            results.put(_DONE)
+
+    threading.Thread(target=feed, daemon=True).start()
+    while True:
+        entry = results.get()
+        if entry is _DONE:
+            return
+        yield entry
+
+def successful(results, stage):
+    for item, result, error in results:
+        if error is None:
+            yield result
+        elif item is None:
+            raise error
+        else:
+            eprint(f"[ERROR] {stage} failed for {item.get('File Path') or item.get('file_path')}: {error}")
+
+def run_pipeline(url, playlistUrl, thumbnailUrl, service, media, concurrency=DEFAULT_CONCURRENCY, embed_workers=1, on_progress=None,
+                 thumbnail_format=DEFAULT_THUMBNAIL_FORMAT, resume=True, profile=DEFAULT_PROFILE):
+    # Every finished stage goes into the job journal, so running the same link
+    # again (after a crash or a failed track) starts each track where it stopped.
+    job = get_journal().start(url, service, media, fresh=not resume, profile=profile)
+    track_numbers = {}
+    album_locks = {}
+    art_paths = {}
+    guard = threading.Lock()
+
+    def enrich(track):
+        track_number = track['Track Number']
+        track_numbers[track['File Path']] = track_number
+
+        record = job.completed(track_number, 'art_ready')
+        if record is not None and (not record['album art path'] or os.path.exists(record['album art path'])):
+            return record
+
+        track = {**track, "Album URL": playlistUrl}
+        record = job.completed(track_number, 'enriched')
+        if record is None:
+            record = enrich_track(track)
+            job.record(track_number, 'enriched', record)
+
+        # The first track of an album prepares its art; the others wait for it
+        # so they never reach the embedder before the image exists.
+        album = track['Album']
+        with guard:
+            lock = album_locks.setdefault(album, threading.Lock())
+        with lock:
+            if album not in art_paths:
+                try:
+                    prepare_album_art(track, record, thumbnail_format)
+                except Exception as e:
+                    eprint(f"[ERROR] Failed to prepare album art for {album}: {e}")
+                art_paths[album] = record['album art path']
+            record['album art path'] = art_paths[album]
+        job.record(track_number, 'art_ready', record)
+        return record
+
+    def embed(record):
+        track_number = track_numbers[record['file_path']]
+        if job.completed(track_number, 'tagged') is not None:
+            return record
+
+        result = embed_metadata([record])[0]
+        if not result["ok"]:
+            raise RuntimeError(result["error"])
+        job.record(track_number, 'tagged', record, record['file_path'])
+        return record
+
+    downloads = stream_song(url, playlistUrl, thumbnailUrl, service, media, concurrency=concurrency, on_progress=on_progress, job=job, profile=profile)
+    enriched = successful(threaded_stage(enrich, downloads, concurrency), 'enrich')
+    yield from successful(threaded_stage(embed, enriched, embed_workers), 'embed')
+    job.finish()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, enrich and tag a link, streaming one NDJSON record per tagged track to stdout.")
+    parser.add_argument('url')
+    parser.add_argument('playlistUrl', nargs='?')
+    parser.add_argument('thumbnailUrl', nargs='?')
+    parser.add_argument('service', nargs='?', default='youtube_music')
+    parser.add_argument('media', nargs='?', default='album')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--embed-workers', type=int, default=1)
+    parser.add_argument('--thumbnail-format', choices=['png', 'jpeg'], default=DEFAULT_THUMBNAIL_FORMAT)
+    parser.add_argument('--profile', choices=PROFILES, default=DEFAULT_PROFILE, help="output format, see download_song.PROFILES")
+    parser.add_argument('--fresh', dest='resume', action='store_false', help="ignore the job journal and redo every track")
+    args = parser.parse_args()
+
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    # Stage logging goes to stderr; stdout is reserved for the NDJSON stream.
+    sys.stdout = sys.stderr
+
+    for record in run_pipeline(args.url, args.playlistUrl, args.thumbnailUrl, args.service, args.media,
+                               concurrency=args.concurrency, embed_workers=args.embed_workers,
+                               thumbnail_format=args.thumbnail_format, resume=args.resume,
+                               profile=args.profile):
+        stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        stdout.flush()
@@ -0,0 +1,79 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Plumbing shared by the SQLite-backed stores (cache_store, thumbnail_store,
+# library_index, job_journal): connections, warnings, process-wide
+# instances and the "is this still the file we recorded" check.
+
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+@contextmanager
+def connect(path):
+    # One connection per operation, committed on success and always closed.
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+class Lazy:
+    # A process-wide instance built by `factory` on first call. reset() drops
+    # it so the next call builds a fresh one.
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+
+    def __call__(self):
+        with self._lock:
+            if self._value is None:
+                self._value = self.factory()
+            return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = None
+
+def file_unchanged(path, size, mtime_ns, expected, hash_file, on_rehashed=None):
+    # Whether the file at `path` is still the one recorded with this size,
+    # mtime and hash. An unchanged size and mtime is trusted; otherwise the
+    # file is re-hashed with hash_file, and when it still matches
+    # on_rehashed(size, mtime_ns) is called so the caller can store the new
+    # values and skip the hash next time.
+    try:
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+            return True
+        if hash_file(path) != expected:
+            return False
+    except OSError:
+        return False
+    if on_rehashed is not None:
+        on_rehashed(stat.st_size, stat.st_mtime_ns)
+    return True
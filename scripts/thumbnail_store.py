@@ -0,0 +1,188 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from cache_store import CACHE_DIR
+from store_utils import Lazy, connect, eprint
+import metrics
+
+THUMBNAIL_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+THUMBNAIL_STORE_MAX_BYTES = 256 * 1024 * 1024
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+class ThumbnailStore:
+    # Content-addressed album art. Each rendered thumbnail is saved once as
+    # <sha256>.<ext> and the index maps every source (URL plus render settings)
+    # to the image it produced, so identical covers are stored once and a
+    # known source never has to be downloaded again. The least recently used
+    # images are deleted once the store grows past `max_bytes`.
+
+    def __init__(self, root=THUMBNAIL_DIR, max_bytes=THUMBNAIL_STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " digest TEXT PRIMARY KEY,"
+                " ext TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                " source TEXT PRIMARY KEY,"
+                " digest TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sources_digest ON sources (digest)")
+            conn.execute("CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed)")
+
+    def _connect(self):
+        return connect(os.path.join(self.root, 'index.sqlite'))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.count('cache_hits' if hit else 'cache_misses', cache='thumbnails')
+
+    @staticmethod
+    def source_key(url, size, fmt):
+        return f"{fmt}:{size}:{url}"
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.root, f"{digest}.{ext}")
+
+    def digest_for(self, path):
+        # The content hash of a path inside the store, or None for any other path.
+        if os.path.abspath(os.path.dirname(path)) != os.path.abspath(self.root):
+            return None
+        digest = os.path.splitext(os.path.basename(path))[0]
+        if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+            return None
+        return digest
+
+    def lookup(self, url, size, fmt):
+        # Path of the thumbnail already rendered from this source, or None.
+        path = None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT b.digest, b.ext FROM sources s JOIN blobs b ON b.digest = s.digest WHERE s.source = ?",
+                    (self.source_key(url, size, fmt),)
+                ).fetchone()
+                if row is not None:
+                    candidate = self.path_for(*row)
+                    if os.path.exists(candidate):
+                        conn.execute("UPDATE blobs SET accessed = ? WHERE digest = ?", (time.time(), row[0]))
+                        path = candidate
+                    else:
+                        # Deleted behind our back; forget it so it is rendered again.
+                        self._forget(conn, row[0])
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Thumbnail index read failed for {url}: {e}")
+
+        self._count(path is not None)
+        return path
+
+    def read(self, path):
+        # (bytes, digest) for a path inside the store, or None for other paths.
+        digest = self.digest_for(path)
+        if digest is None:
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE blobs SET accessed = ? WHERE digest = ?", (time.time(), digest))
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Thumbnail index update failed for {path}: {e}")
+        return data, digest
+
+    def add(self, url, size, fmt, ext, data):
+        digest = content_digest(data)
+        path = self.path_for(digest, ext)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs (digest, ext, size, accessed) VALUES (?, ?, ?, ?)",
+                    (digest, ext, len(data), now)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (source, digest) VALUES (?, ?)",
+                    (self.source_key(url, size, fmt), digest)
+                )
+                self._evict(conn, keep=digest)
+        except sqlite3.Error as e:
+            eprint(f"[WARN] Thumbnail index write failed for {url}: {e}")
+        return path, digest
+
+    def _forget(self, conn, digest):
+        conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+        conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+
+    def _evict(self, conn, keep=None):
+        if self.max_bytes is None:
+            return
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for digest, ext, size in conn.execute("SELECT digest, ext, size FROM blobs ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            stale.append((digest, ext))
+            total -= size
+
+        for digest, ext in stale:
+            self._forget(conn, digest)
+            try:
+                os.remove(self.path_for(digest, ext))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            sources = conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "images": count, "sources": sources, "bytes": total}
+
+get_thumbnail_store = Lazy(ThumbnailStore)
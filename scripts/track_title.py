@@ -0,0 +1,34 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Title clean-up shared by the downloader and the track-URL resolver. Kept
+# free of other imports so the resolver can use it without loading yt-dlp,
+# the job journal or the library index.
+
+import re
+
+def clean_track_title(title):
+    if not title or title == 'N/A':
+        return 'N/A'
+    title = re.sub(r'\s*[\(\[].*?(official|audio|video|lyrics?|HD|4K).*?[\)\]]', '', title, flags=re.IGNORECASE)
+    if ' - ' in title:
+        title = title.split(' - ', 1)[1]
+    title = re.sub(r'\s*[\(\[]\s*(?!feat\.|ft\.)[^)\]]*[\)\]]', '', title, flags=re.IGNORECASE)
+    return title.strip()
@@ -0,0 +1,137 @@
+# Copyright (c) 2025 Kyle-Aaron-Merrill
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Long-lived Python side of the app. main.js starts this once and sends it
+# JSON-lines requests on stdin:
+#
+#   {"id": 1, "command": "run_pipeline", "args": {...}}
+#
+# and every request gets exactly one JSON line back on stdout:
+#
+#   {"id": 1, "ok": true, "result": ...}
+#   {"id": 1, "ok": false, "error": "..."}
+#
+# The stage modules, the OpenAI client and the caches are imported once and
+# stay warm between requests. Anything the stages print goes to stderr so
+# stdout only ever carries protocol lines.
+
+import io
+import json
+import sys
+import traceback
+from contextlib import redirect_stdout
+
+from download_song import download_song, DEFAULT_CONCURRENCY, DEFAULT_PROFILE
+from fetch_metadata import fetch_metadata, DEFAULT_THUMBNAIL_FORMAT
+from embed_metadata import embed_metadata
+from get_track_url import resolve_tracks
+import pipeline
+import metrics
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+def download(args):
+    playlistUrl = args.get('playlistUrl')
+    metadata_list = download_song(
+        args['url'],
+        playlistUrl,
+        args.get('thumbnailUrl'),
+        args['service'],
+        args['media'],
+        concurrency=args.get('concurrency', DEFAULT_CONCURRENCY),
+        profile=args.get('profile', DEFAULT_PROFILE)
+    )
+    metadata_list = [track for track in metadata_list if track]
+    for track in metadata_list:
+        track["Album URL"] = playlistUrl
+    return metadata_list
+
+def enrich(args):
+    return fetch_metadata(args['tracks'], batch=args.get('batch', True), concurrency=args.get('concurrency', DEFAULT_CONCURRENCY),
+                          thumbnail_format=args.get('thumbnail_format', DEFAULT_THUMBNAIL_FORMAT))
+
+def embed(args):
+    results = embed_metadata(args['tracks'])
+    return {"tagged": sum(1 for result in results if result["ok"]), "results": results}
+
+def run_pipeline(args):
+    records = pipeline.run_pipeline(
+        args['url'],
+        args.get('playlistUrl'),
+        args.get('thumbnailUrl'),
+        args['service'],
+        args['media'],
+        concurrency=args.get('concurrency', DEFAULT_CONCURRENCY),
+        thumbnail_format=args.get('thumbnail_format', DEFAULT_THUMBNAIL_FORMAT),
+        resume=args.get('resume', True),
+        profile=args.get('profile', DEFAULT_PROFILE)
+    )
+    return sorted(records, key=lambda record: record.get('track_number') or 0)
+
+COMMANDS = {
+    'ping': lambda args: 'pong',
+    'download': download,
+    'enrich': enrich,
+    'embed': embed,
+    'run_pipeline': run_pipeline,
+    'resolve_tracks': lambda args: resolve_tracks(args['playlistUrl'], args['tracks']),
+    'metrics': lambda args: metrics.snapshot(),
+}
+
+def handle(request):
+    command = COMMANDS.get(request.get('command'))
+    if command is None:
+        return {"ok": False, "error": f"Unknown command: {request.get('command')}"}
+    try:
+        with redirect_stdout(sys.stderr):
+            return {"ok": True, "result": command(request.get('args') or {})}
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        return {"ok": False, "error": str(e)}
+    finally:
+        # The worker rarely exits, so keep the Prometheus file current.
+        if metrics.METRICS_PROM:
+            metrics.write_prometheus()
+
+def serve(stdin, stdout):
+    for line in stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            eprint(f"[ERROR] Invalid request: {e}")
+            continue
+        if request.get('command') == 'shutdown':
+            stdout.write(json.dumps({"id": request.get('id'), "ok": True, "result": None}) + "\n")
+            stdout.flush()
+            break
+
+        response = handle(request)
+        stdout.write(json.dumps({"id": request.get('id'), **response}, ensure_ascii=False, default=str) + "\n")
+        stdout.flush()
+
+if __name__ == "__main__":
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    eprint("[INFO] Python worker ready")
+    serve(stdin, stdout)